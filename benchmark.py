@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+from book import Chapter, RawBook
+
+from typing import Callable, Dict, List, Set
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+# Common characters for body text
+bodyCharacters: str = "的一是了我不人在他有這個上們來到時大地為子中你說生國年著就那和要她出也得裡後自以會家可下而過天去能對小多然於心學麼之都好看起發當沒成只如事把還用第樣道想作種開美總從無情己面最女但現前些所同日手又行意動方期它頭經長兒回位分愛老因很給名法間斯知世什兩次使身者被高已親其進此話常與活正感"
+punctuations: str = "，。！？……「」"
+
+
+# Smallest valid PNG image
+def tinyPng() -> bytes:
+  def chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+  return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0)) + chunk(b"IDAT", zlib.compress(b"\x00\x00")) + chunk(b"IEND", b"")
+
+
+# Write a TSDM/LK style book with images into its own directory, return text path
+def generateBook(dirPath: str, size: int, chapterCount: int, source: str = "tsdm", illustrationCount: int = -1, seed: int = 0) -> str:
+  textPath: str = os.path.join(dirPath, "book.txt")
+  if os.path.exists(textPath):
+    return textPath
+  os.makedirs(dirPath, exist_ok=True)
+  randomGenerator = random.Random(seed)
+
+  # Reuse a pool of lines, generating every line is slow for large books
+  bodyLines: List[str] = []
+  for _ in range(1000):
+    words: List[str] = randomGenerator.choices(bodyCharacters, k=randomGenerator.randint(10, 80))
+    for position in range(8, len(words), randomGenerator.randint(6, 16)):
+      words[position] = randomGenerator.choice(punctuations)
+    bodyLines.append("　　" + "".join(words))
+
+  # Chapters are grouped in volumes of up to 50 chapters
+  volumeCount: int = max(1, chapterCount // 50)
+  contents: List[Chapter] = []
+  volume: int = -1
+  for number in range(chapterCount):
+    if number * volumeCount // chapterCount != volume:
+      volume = number * volumeCount // chapterCount
+      contents.append(Chapter("第%d卷" % (volume + 1), 0))
+    contents.append(Chapter("第%d章 %s" % (number + 1, "".join(randomGenerator.choices(bodyCharacters, k=randomGenerator.randint(2, 12)))), 1))
+
+  if illustrationCount < 0:
+    illustrationCount = min(300, chapterCount // 4 + 1)
+  illustrationChapters: Set[int] = set(randomGenerator.sample(range(len(contents)), min(illustrationCount, len(contents))))
+  png: bytes = tinyPng()
+
+  chapterSize: int = max(1, size // len(contents))
+  with open(textPath, "wt", encoding="utf-8", newline="\n") as file:
+    file.write("".join(randomGenerator.choices(bodyCharacters, k=8)) + "\n")
+    file.write("作者：" + "".join(randomGenerator.choices(bodyCharacters, k=3)) + "\n")
+    file.write("插畫：" + "".join(randomGenerator.choices(bodyCharacters, k=3)) + "\n")
+    file.write("譯者：" + "".join(randomGenerator.choices(bodyCharacters, k=3)) + "\n")
+    file.write({"tsdm": "www.tsdm39.net", "lk": "www.lightnovel.us"}[source] + "\n")
+    file.write("　\nCONTENTS\n")
+    for chapter in contents:
+      file.write("\t" * chapter.level + chapter.string + "\n")
+    file.write("　\n")
+
+    for number, chapter in enumerate(contents):
+      # Title illustration is right before chapter title
+      if number in illustrationChapters:
+        name: str = "img%04d" % number
+        with open(os.path.join(dirPath, name + ".png"), "wb") as image:
+          image.write(png)
+        file.write("　　（%s）\n" % name)
+      file.write(chapter.string + "\n　\n")
+      written: int = 0
+      while written < chapterSize:
+        line: str = randomGenerator.choice(bodyLines)
+        file.write(line + "\n")
+        written += len(line.encode("utf-8")) + 1
+        if randomGenerator.random() < 0.1:
+          file.write("　\n")
+      file.write("　\n")
+  return textPath
+
+
+# Peak resident memory of this process in bytes
+def peakRss() -> int:
+  peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Time every conversion stage of one book in this process
+def runCase(textPath: str, traceMemory: bool = False) -> Dict[str, Dict]:
+  stages: Dict[str, Dict] = {}
+  if traceMemory:
+    tracemalloc.start()
+
+  def measure(name: str, function: Callable[[], object]) -> object:
+    if traceMemory:
+      tracemalloc.reset_peak()
+    startTime = time.perf_counter()
+    result = function()
+    stages[name] = {"time": time.perf_counter() - startTime, "peakRss": peakRss()}
+    if traceMemory:
+      stages[name]["peakTraced"] = tracemalloc.get_traced_memory()[1]
+    return result
+
+  book: RawBook = measure("RawBook.__init__", lambda: RawBook(textPath))
+  # Already run in __init__, run again to time it alone
+  measure("initMetadata", book.initMetadata)
+  measure("initContents", book.initContents)
+  measure("initChaptersIndex", book.initChaptersIndex)
+  measure("findIllustrationsIndex", lambda: book.findIllustrationsIndex(book.illustrationPrefix, book.illustrationSuffix))
+  epubPath: str = os.path.splitext(textPath)[0] + ".epub"
+  measure("writeEpub", lambda: (book.initEpub(), book.writeEpub(epubPath)))
+  stages["writeEpub"]["epubSize"] = os.path.getsize(epubPath)
+  stages["total"] = {"time": sum(stage["time"] for stage in stages.values()), "peakRss": peakRss(), "chapters": len(book.contents), "unmatched": len([chapter for chapter in book.contents if chapter.index < 0])}
+  book.reset()
+  return stages
+
+
+# Modules used without UI, they must start fast for CLI and worker processes
+headlessModules: List[str] = ["book", "cli", "watch"]
+# Packages imported only when EPUB, images or UI are needed
+lazyPackages: Set[str] = {"ebooklib", "lxml", "PIL", "PySide6"}
+# Milliseconds a headless module may take to import as reported by -X importtime
+importBudgetMs: float = 100.0
+
+
+# Import module in a new interpreter with -X importtime, return cumulative import time and lazy packages it loaded
+# Bytecode is written by an untimed import first, as an installed program has it
+def measureImport(module: str) -> Dict:
+  environment: Dict[str, str] = {**os.environ, "PYTHONDONTWRITEBYTECODE": ""}
+  subprocess.run([sys.executable, "-c", "import %s" % module], cwd=os.path.dirname(os.path.abspath(__file__)), env=environment, capture_output=True, check=True)
+  command: List[str] = [sys.executable, "-X", "importtime", "-c", "import %s" % module]
+  stderr: str = subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=environment, capture_output=True, text=True, check=True).stderr
+  measurement: Dict = {"time": 0.0, "lazyLoaded": []}
+  for line in stderr.splitlines():
+    # "import time: self [us] | cumulative | imported package"
+    fields: List[str] = line.split("|")
+    if not line.startswith("import time:") or len(fields) != 3 or not fields[1].strip().isdigit():
+      continue
+    name: str = fields[2].strip()
+    if name == module and fields[2][1:] == name:
+      measurement["time"] = int(fields[1]) / 1e6
+    if name.split(".")[0] in lazyPackages and name.split(".")[0] not in measurement["lazyLoaded"]:
+      measurement["lazyLoaded"].append(name.split(".")[0])
+  return measurement
+
+
+# Current commit of the repository, empty if unknown
+def gitCommit() -> str:
+  try:
+    return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return ""
+
+
+# Print time change of every stage against older results
+def compareResults(oldResults: Dict, results: Dict):
+  for module, measurement in results["imports"].items():
+    oldMeasurement = oldResults.get("imports", {}).get(module)
+    if oldMeasurement is not None and oldMeasurement["time"] > 0:
+      print("%-24s %-24s %9.3fs -> %9.3fs %+7.1f%%" % ("import", module, oldMeasurement["time"], measurement["time"], (measurement["time"] / oldMeasurement["time"] - 1) * 100))
+  oldCases: Dict[str, Dict] = {case["name"]: case for case in oldResults["cases"]}
+  for case in results["cases"]:
+    if case["name"] not in oldCases:
+      continue
+    for stage, measurement in case["stages"].items():
+      oldMeasurement = oldCases[case["name"]]["stages"].get(stage)
+      if oldMeasurement is None or oldMeasurement["time"] == 0:
+        continue
+      print("%-24s %-24s %9.3fs -> %9.3fs %+7.1f%%" % (case["name"], stage, oldMeasurement["time"], measurement["time"], (measurement["time"] / oldMeasurement["time"] - 1) * 100))
+
+
+def main(argv: List[str] = None) -> int:
+  parser = argparse.ArgumentParser(description="Benchmark conversion stages on generated TSDM/LK books")
+  parser.add_argument("--sizes", default="1,10,100", help="text sizes in MB, comma separated")
+  parser.add_argument("--chapters", default="10,500,5000", help="chapter counts, comma separated")
+  parser.add_argument("--sources", default="tsdm,lk", help="text types, comma separated")
+  parser.add_argument("--repeat", type=int, default=1, help="runs of every case, fastest run is kept")
+  parser.add_argument("--corpus", default=os.path.join(tempfile.gettempdir(), "simplepub-benchmark"), help="generated books directory, books are reused")
+  parser.add_argument("--tracemalloc", action="store_true", help="also record peak traced Python memory, slows stages down")
+  parser.add_argument("--output", default="", help="write results JSON to this file")
+  parser.add_argument("--compare", default="", help="results JSON to compare with")
+  parser.add_argument("--import-budget", type=float, default=importBudgetMs, help="fail if importing a headless module takes longer than this many ms or loads EPUB, image or UI packages, 0 is no check")
+  parser.add_argument("--imports-only", action="store_true", help="only measure import times")
+  parser.add_argument("--run-case", default="", help=argparse.SUPPRESS)
+  args = parser.parse_args(argv)
+
+  # Child process measures one book, so peak memory is not shared by cases
+  if args.run_case != "":
+    print(json.dumps(runCase(args.run_case, args.tracemalloc)))
+    return 0
+
+  results: Dict = {"commit": gitCommit(), "python": platform.python_version(), "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "imports": {}, "cases": []}
+  failed: bool = False
+  for module in headlessModules:
+    measurement: Dict = min((measureImport(module) for _ in range(max(1, args.repeat))), key=lambda measurement: measurement["time"])
+    results["imports"][module] = measurement
+    overBudget: bool = args.import_budget > 0 and (measurement["time"] * 1000 > args.import_budget or measurement["lazyLoaded"] != [])
+    failed = failed or overBudget
+    print("%-24s %-24s %9.3fs%s%s" % ("import", module, measurement["time"], " loads " + ", ".join(measurement["lazyLoaded"]) if measurement["lazyLoaded"] != [] else "", " OVER BUDGET" if overBudget else ""), flush=True)
+
+  for source in args.sources.split(",") if not args.imports_only else []:
+    for size in [int(size) for size in args.sizes.split(",")]:
+      for chapterCount in [int(chapterCount) for chapterCount in args.chapters.split(",")]:
+        name: str = "%s-%dmb-%dch" % (source, size, chapterCount)
+        print("Generating %s" % name, file=sys.stderr, flush=True)
+        textPath: str = generateBook(os.path.join(args.corpus, name), size << 20, chapterCount, source)
+
+        runs: List[Dict] = []
+        for _ in range(args.repeat):
+          command: List[str] = [sys.executable, os.path.abspath(__file__), "--run-case", textPath] + (["--tracemalloc"] if args.tracemalloc else [])
+          runs.append(json.loads(subprocess.run(command, capture_output=True, text=True, check=True).stdout))
+        stages: Dict[str, Dict] = min(runs, key=lambda run: run["total"]["time"])
+        results["cases"].append({"name": name, "source": source, "size": os.path.getsize(textPath), "chapters": chapterCount, "stages": stages})
+        print("%-24s %s" % (name, ", ".join("%s: %.3fs" % (stage, measurement["time"]) for stage, measurement in stages.items())), flush=True)
+
+  if args.output != "":
+    with open(args.output, "wt", encoding="utf-8") as file:
+      json.dump(results, file, indent=2)
+  if args.compare != "":
+    with open(args.compare, "rt", encoding="utf-8") as file:
+      compareResults(json.load(file), results)
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
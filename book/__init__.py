@@ -0,0 +1,7 @@
+# Book conversion core without UI, ebooklib and lxml are imported when EPUB is first written
+from book.chapter import Chapter, ChapterStatus
+from book.rawbook import RawBook, listIllustrationsPath, observedStage, trieRegex
+from book.sources import RawTextType
+from book.text import TextLines, detectEncoding, readFile
+
+__all__ = ["Chapter", "ChapterStatus", "RawBook", "RawTextType", "TextLines", "detectEncoding", "listIllustrationsPath", "observedStage", "readFile", "trieRegex"]
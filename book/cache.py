@@ -0,0 +1,128 @@
+from typing import Dict, List, Optional, Tuple, Union
+import hashlib
+import json
+import os
+import tempfile
+
+
+# Hash file content
+def hashFile(filePath: str) -> str:
+  sha256 = hashlib.sha256()
+  with open(filePath, "rb") as file:
+    for chunk in iter(lambda: file.read(1 << 20), b""):
+      sha256.update(chunk)
+  return sha256.hexdigest()
+
+
+# Write file by renaming a temporary file, other processes never see a partial file
+def writeFileAtomic(filePath: str, content: bytes):
+  os.makedirs(os.path.dirname(filePath), exist_ok=True)
+  fileDescriptor, temporaryPath = tempfile.mkstemp(dir=os.path.dirname(filePath))
+  try:
+    with os.fdopen(fileDescriptor, "wb") as file:
+      file.write(content)
+    os.replace(temporaryPath, filePath)
+  except BaseException:
+    os.remove(temporaryPath)
+    raise
+
+
+# Mark file as recently used, modification time is its last use
+def touchFile(filePath: str):
+  try:
+    os.utime(filePath)
+  except OSError:
+    pass
+
+
+# Remove least recently used files with extensions until files are at most maxBytes, return bytes removed
+# Only cache entries are removed, temporary files are being written by other processes
+def trimFiles(dirPath: str, maxBytes: int, extensions: Tuple[str, ...]) -> int:
+  if maxBytes <= 0:
+    return 0
+  # (last use time, size, path) of every entry
+  entries: List[Tuple[int, int, str]] = []
+  for subDirPath, _, fileNames in os.walk(dirPath):
+    for fileName in fileNames:
+      if not fileName.endswith(extensions):
+        continue
+      try:
+        status = os.stat(os.path.join(subDirPath, fileName))
+      except OSError:
+        continue
+      entries.append((status.st_mtime_ns, status.st_size, os.path.join(subDirPath, fileName)))
+  cacheBytes: int = sum(size for _, size, _ in entries)
+  removedBytes: int = 0
+  for _, size, filePath in sorted(entries):
+    if cacheBytes - removedBytes <= maxBytes:
+      break
+    try:
+      os.remove(filePath)
+    except OSError:
+      continue
+    removedBytes += size
+  return removedBytes
+
+
+# Content addressed cache of converted books and rendered chapters
+# Least recently used files are removed by trim when cache is larger than maxBytes
+class ConversionCache:
+  # Change when rendered XHTML changes to drop old chapters
+  version: str = "1"
+  cacheDirPath: str = os.path.join(os.path.expanduser("~"), ".cache", "simplepub")
+  # Rendered chapters of a library would otherwise be kept forever, 0 is no limit
+  maxBytes: int = 512 << 20
+  entryExtensions: Tuple[str, ...] = (".json", ".xhtml")
+
+  def __init__(self, cacheDirPath: str = "", maxBytes: int = -1):
+    if cacheDirPath != "":
+      self.cacheDirPath = cacheDirPath
+    if maxBytes >= 0:
+      self.maxBytes = maxBytes
+
+  # Hash all parts in order
+  def key(self, *parts: Union[str, bytes]) -> str:
+    sha256 = hashlib.sha256(self.version.encode("utf-8"))
+    for part in parts:
+      part = part.encode("utf-8") if isinstance(part, str) else part
+      # Prefix length to keep parts apart
+      sha256.update(b"%d:" % len(part))
+      sha256.update(part)
+    return sha256.hexdigest()
+
+  def path(self, kind: str, key: str, extension: str) -> str:
+    return os.path.join(self.cacheDirPath, kind, key[0:2], key + extension)
+
+  # Remove least recently used entries until cache is at most maxBytes, return bytes removed
+  def trim(self) -> int:
+    return trimFiles(self.cacheDirPath, self.maxBytes, self.entryExtensions)
+
+  # Get summary of converted book if its EPUB is still the one written
+  def getBook(self, key: str) -> Optional[Dict]:
+    try:
+      with open(self.path("books", key, ".json"), "rt", encoding="utf-8") as file:
+        record: Dict = json.load(file)
+      status = os.stat(record["epub"])
+    except (OSError, ValueError, KeyError):
+      return None
+    if status.st_size != record["size"] or status.st_mtime_ns != record["mtime"]:
+      return None
+    touchFile(self.path("books", key, ".json"))
+    return record["summary"]
+
+  def putBook(self, key: str, epubPath: str, summary: Dict):
+    status = os.stat(epubPath)
+    record: Dict = {"epub": epubPath, "size": status.st_size, "mtime": status.st_mtime_ns, "summary": summary}
+    writeFileAtomic(self.path("books", key, ".json"), json.dumps(record, ensure_ascii=False).encode("utf-8"))
+
+  def getChapter(self, key: str) -> Optional[bytes]:
+    try:
+      with open(self.path("chapters", key, ".xhtml"), "rb") as file:
+        content: bytes = file.read()
+    except OSError:
+      return None
+    touchFile(self.path("chapters", key, ".xhtml"))
+    return content
+
+  def putChapter(self, key: str, content: bytes):
+    writeFileAtomic(self.path("chapters", key, ".xhtml"), content)
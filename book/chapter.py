@@ -0,0 +1,23 @@
+from enum import Enum
+
+
+# Chapter location state
+class ChapterStatus(Enum):
+  unknown: int = 0
+  found: int = 1
+  notFound: int = 2
+  outOfOrder: int = 3
+
+
+# Index chapter
+class Chapter:
+  string: str = ""
+  level: int = 0
+  index: int = 0
+  illustration: bool = False
+  status: ChapterStatus = ChapterStatus.unknown
+
+  def __init__(self, string: str, level: int = 0, index: int = 0):
+    self.string = string
+    self.level = level
+    self.index = index
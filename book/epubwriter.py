@@ -0,0 +1,102 @@
+from ebooklib import epub
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Iterator, Tuple
+import os
+import time
+import zipfile
+import zlib
+
+
+# EPUB item rendered only when the writer asks for its content
+class LazyEpubItem(epub.EpubItem):
+  def __init__(self, uid: str, fileName: str, mediaType: str, render: Callable[[], bytes]):
+    super().__init__(uid, fileName, mediaType)
+    self.render = render
+
+  def get_content(self, default=None) -> bytes:
+    return self.render()
+
+
+# Compressed entry data, CRC and seconds spent, run in compression threads
+def compressEntry(data: bytes, compressType: int, compressLevel: int) -> Tuple[bytes, int, float]:
+  startTime = time.perf_counter()
+  crc: int = zlib.crc32(data)
+  if compressType == zipfile.ZIP_STORED:
+    return data, crc, time.perf_counter() - startTime
+  # Raw deflate stream without zlib header, as stored in ZIP
+  compressor = zlib.compressobj(compressLevel, zlib.DEFLATED, -15)
+  compressed: bytes = compressor.compress(data) + compressor.flush()
+  return compressed, crc, time.perf_counter() - startTime
+
+
+# EPUB writer storing already compressed images and deflating other entries in threads
+# Entries are still written in item order after mimetype, container and package document
+class PackageWriter(epub.EpubWriter):
+  # Images are already compressed, deflating them saves almost nothing
+  storedExtensions: Tuple[str, ...] = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+  # Entries compressed ahead of the one being written, bounds memory of compressed entries
+  compressAhead: int = 16
+
+  def __init__(self, name: str, book: epub.EpubBook, options: dict = None, compressLevel: int = 6, storeImages: bool = True, compressJobs: int = 1):
+    super().__init__(name, book, options)
+    self.compressLevel = compressLevel
+    self.storeImages = storeImages
+    self.compressJobs = max(1, compressJobs)
+    # Totals of written items
+    self.storedBytes: int = 0
+    self.deflatedBytes: int = 0
+    self.compressedBytes: int = 0
+    self.compressSeconds: float = 0.0
+
+  # (path in EPUB, content) of every item, same paths as EpubWriter
+  def __itemEntries(self) -> Iterator[Tuple[str, bytes]]:
+    for item in self.book.get_items():
+      if isinstance(item, epub.EpubNcx):
+        yield "%s/%s" % (self.book.FOLDER_NAME, item.file_name), self._get_ncx()
+      elif isinstance(item, epub.EpubNav):
+        yield "%s/%s" % (self.book.FOLDER_NAME, item.file_name), self._get_nav(item)
+      elif item.manifest:
+        yield "%s/%s" % (self.book.FOLDER_NAME, item.file_name), item.get_content()
+      else:
+        yield item.file_name, item.get_content()
+
+  # Items are rendered in order in this thread, compressed in threads and appended in order
+  def _write_items(self):
+    with ThreadPoolExecutor(max_workers=self.compressJobs) as executor:
+      # (entry, future of compressed data) in item order
+      pending: Deque[Tuple[zipfile.ZipInfo, Future]] = deque()
+      for name, content in self.__itemEntries():
+        data: bytes = content.encode("utf-8") if isinstance(content, str) else content
+        entry = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+        entry.external_attr = 0o600 << 16
+        entry.compress_type = zipfile.ZIP_STORED if self.storeImages and os.path.splitext(name)[1].lower() in self.storedExtensions else zipfile.ZIP_DEFLATED
+        entry.file_size = len(data)
+        pending.append((entry, executor.submit(compressEntry, data, entry.compress_type, self.compressLevel)))
+        while len(pending) > self.compressAhead or (pending and pending[0][1].done()):
+          self.__writeEntry(*pending.popleft())
+      while pending:
+        self.__writeEntry(*pending.popleft())
+
+  # Append compressed entry, same steps as ZipFile.writestr after its compressor
+  def __writeEntry(self, entry: zipfile.ZipInfo, future: Future):
+    compressed, entry.CRC, seconds = future.result()
+    entry.compress_size = len(compressed)
+    zipFile: zipfile.ZipFile = self.out
+    zipFile.fp.seek(zipFile.start_dir)
+    entry.header_offset = zipFile.fp.tell()
+    zipFile._writecheck(entry)
+    zipFile._didModify = True
+    zipFile.fp.write(entry.FileHeader())
+    zipFile.fp.write(compressed)
+    zipFile.filelist.append(entry)
+    zipFile.NameToInfo[entry.filename] = entry
+    zipFile.start_dir = zipFile.fp.tell()
+
+    if entry.compress_type == zipfile.ZIP_STORED:
+      self.storedBytes += entry.file_size
+    else:
+      self.deflatedBytes += entry.file_size
+    self.compressedBytes += entry.compress_size
+    self.compressSeconds += seconds
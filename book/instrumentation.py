@@ -0,0 +1,72 @@
+from typing import Dict, List
+import os
+import threading
+import time
+
+
+# Receive stage timings and counters of RawBook, override methods to observe
+class BookObserver:
+  def stageStarted(self, stage: str):
+    pass
+
+  def stageFinished(self, stage: str, seconds: float):
+    pass
+
+  # Value is added to counter
+  def counted(self, counter: str, value: int):
+    pass
+
+  # Value replaces gauge
+  def measured(self, gauge: str, value: float):
+    pass
+
+
+# Collect stage timings and counters, export as JSON or Chrome trace
+class Instrumentation(BookObserver):
+  def __init__(self, name: str = ""):
+    self.name = name
+    # {"stage", "start", "seconds", "thread"}, start is seconds since epoch
+    self.events: List[Dict] = []
+    self.counters: Dict[str, float] = {}
+    # Convert perf_counter to epoch time, so traces of processes line up
+    self.__epochOffset: float = time.time() - time.perf_counter()
+
+  def stageFinished(self, stage: str, seconds: float):
+    self.events.append({"stage": stage, "start": self.__epochOffset + time.perf_counter() - seconds, "seconds": seconds, "thread": threading.get_ident()})
+
+  def counted(self, counter: str, value: int):
+    self.counters[counter] = self.counters.get(counter, 0) + value
+
+  def measured(self, gauge: str, value: float):
+    self.counters[gauge] = value
+
+  # Total seconds of every stage
+  def stageTimes(self) -> Dict[str, float]:
+    times: Dict[str, float] = {}
+    for event in self.events:
+      times[event["stage"]] = times.get(event["stage"], 0.0) + event["seconds"]
+    return times
+
+  def toDict(self) -> Dict:
+    return {"name": self.name, "stages": self.stageTimes(), "counters": dict(self.counters), "events": list(self.events)}
+
+  # Chrome trace events, load in chrome://tracing or Perfetto
+  def toChromeTrace(self, pid: int = None) -> List[Dict]:
+    return chromeTraceEvents(self.toDict(), os.getpid() if pid is None else pid)
+
+  # One line summary
+  def summary(self) -> str:
+    parts: List[str] = ["%s: %.3fs" % (stage, seconds) for stage, seconds in self.stageTimes().items()]
+    parts += ["%s: %g" % (counter, value) for counter, value in self.counters.items()]
+    return ", ".join(parts)
+
+
+# Chrome trace events of Instrumentation.toDict result, stage is a complete event and counters are a counter event at end
+def chromeTraceEvents(instrumentation: Dict, pid: int) -> List[Dict]:
+  traceEvents: List[Dict] = []
+  for event in instrumentation["events"]:
+    traceEvents.append({"name": event["stage"], "cat": "simplepub", "ph": "X", "ts": event["start"] * 1e6, "dur": event["seconds"] * 1e6, "pid": pid, "tid": event["thread"], "args": {"book": instrumentation["name"]}})
+  if instrumentation["counters"] != {} and instrumentation["events"] != []:
+    end: float = max(event["start"] + event["seconds"] for event in instrumentation["events"])
+    traceEvents.append({"name": "counters", "cat": "simplepub", "ph": "C", "ts": end * 1e6, "pid": pid, "args": dict(instrumentation["counters"])})
+  return traceEvents
@@ -0,0 +1,138 @@
+from book.sources import SourceProfile
+
+from typing import Callable, Dict, Iterable, Iterator, List, Pattern, Tuple
+import functools
+import re
+import time
+
+# Stage takes (line index, line) pairs and yields normalized pairs, removed lines are not yielded
+# Line index is kept, so illustrations and headings are still found by index
+NormalizeStage = Callable[[Iterator[Tuple[int, str]], SourceProfile], Iterator[Tuple[int, str]]]
+
+
+# Pattern compiled when a stage first runs, compiling every pattern costs more than importing the rest of book
+def lazyPattern(pattern: str) -> Callable[[], Pattern]:
+  return functools.lru_cache(maxsize=None)(lambda: re.compile(pattern))
+
+
+# Space and invisible format characters, line of only these is blank
+blankLinePattern = lazyPattern(r"^[\s\u200b-\u200f\u2060\ufeff]*$")
+
+
+# Remove lines with nothing visible, such as lines of zero-width spaces str.strip keeps
+def removeBlankLines(lines: Iterator[Tuple[int, str]], profile: SourceProfile) -> Iterator[Tuple[int, str]]:
+  pattern: Pattern = blankLinePattern()
+  for index, line in lines:
+    if not pattern.match(line):
+      yield index, line
+
+
+# Small form variants to common full-width punctuations
+punctuationTable: Dict[int, str] = str.maketrans("﹐﹑﹒﹔﹕﹖﹗﹁﹂﹃﹄", "，、．；：？！「」『』")
+# Searching is much faster than translating every line
+smallFormPattern = lazyPattern("[﹐﹑﹒﹔﹕﹖﹗﹁﹂﹃﹄]")
+# Ellipsis typed as dots, or with a single or more than two "…"
+ellipsisPattern = lazyPattern(r"[.。·・]{3,}|…{3,}|(?<!…)…(?!…)")
+# Half-width punctuation next to CJK text
+halfWidthPunctuationPattern = lazyPattern(r"[,!?:;]")
+halfWidthPattern = lazyPattern(r"(?<=[\u3000-\u30ff\u3400-\u9fff\uff00-\uffef])[,!?:;]|[,!?:;](?=[\u3400-\u9fff])")
+fullWidthPunctuations: Dict[str, str] = {",": "，", "!": "！", "?": "？", ":": "：", ";": "；"}
+
+
+# Use full-width punctuations in CJK text and "……" for ellipsis
+def normalizePunctuation(lines: Iterator[Tuple[int, str]], profile: SourceProfile) -> Iterator[Tuple[int, str]]:
+  smallForm, ellipsis, halfWidthPunctuation, halfWidth = smallFormPattern(), ellipsisPattern(), halfWidthPunctuationPattern(), halfWidthPattern()
+  for index, line in lines:
+    if smallForm.search(line):
+      line = line.translate(punctuationTable)
+    line = ellipsis.sub("……", line)
+    if halfWidthPunctuation.search(line):
+      line = halfWidth.sub(lambda match: fullWidthPunctuations[match.group()], line)
+    yield index, line
+
+
+# Simplified and Traditional forms of common characters, one to one in both directions
+# Characters whose other form depends on the word are not converted, such as 发 for 發 and 髮, or 著 for 着 and 著
+chinesePairs: List[str] = (
+  "万萬 与與 专專 业業 丛叢 东東 丝絲 两兩 严嚴 丧喪 个個 临臨 为為 丽麗 举舉 义義 乌烏 乐樂 乔喬 习習 乡鄉 书書 买買 乱亂 争爭 亏虧 亚亞 产產 亩畝 亲親 亿億 仅僅 从從 仓倉 仪儀 们們 众眾 优優 会會 伞傘 伟偉 传傳 伤傷 伦倫 伪偽 体體 侠俠 侣侶 侦偵 侧側 侨僑 俩倆 俭儉 债債 倾傾 偿償 储儲 儿兒 兑兌 兰蘭 关關 兴興 养養 兽獸 内內 冈岡 册冊 写寫 军軍 农農 冯馮 决決 况況 冻凍 净淨 凉涼 减減 凑湊 凤鳳 凭憑 凯凱 击擊 刘劉 则則 刚剛 创創 删刪 刹剎 剂劑 剑劍 剧劇 劝勸 办辦 务務 动動 励勵 劲勁 劳勞 势勢 勋勳 匀勻 区區 医醫 华華 协協 单單 卖賣 卢盧 卫衛 却卻 厅廳 压壓 厌厭 厕廁 厢廂 厨廚 县縣 双雙 变變 叙敘 叠疊 号號 叹嘆 吓嚇 吕呂 吗嗎 吨噸 听聽 启啟 吴吳 员員 呜嗚 咏詠 咙嚨 响響 哑啞 唤喚 啰囉 喷噴 嘱囑 园園 围圍 图圖 国國 圣聖 场場 坏壞 块塊 坚堅 坝壩 坟墳 坠墜 垄壟 垒壘 处處 备備 头頭 夹夾 夺奪 奋奮 奖獎 妆妝 妇婦 妈媽 娱娛 婴嬰 学學 孙孫 宁寧 宝寶 实實 审審 宪憲 宫宮 宽寬 宾賓 对對 寻尋 导導 寿壽 将將 尔爾 尘塵 尝嘗 层層 届屆 属屬 岁歲 岂豈 岛島 峡峽 币幣 师師 带帶 帮幫 广廣 庄莊 庆慶 库庫 应應 废廢 开開 异異 弃棄 张張 弯彎 弹彈 强強 归歸 录錄 彻徹 径徑 忆憶 忧憂 怀懷 态態 怜憐 总總 恋戀 恼惱 悦悅 悬懸 惊驚 惧懼 惨慘 惯慣 愤憤 懒懶 戏戲 战戰 户戶 执執 扩擴 扫掃 扬揚 扰擾 抚撫 抛拋 抢搶 护護 报報 担擔 拟擬 拢攏 拣揀 拥擁 拦攔 拨撥 择擇 挂掛 挡擋 挣掙 挤擠 挥揮 捞撈 损損 换換 掷擲 揽攬 摄攝 摇搖 撑撐 敌敵 数數 斋齋 断斷 无無 旧舊 时時 旷曠 显顯 晋晉 晒曬 晓曉 晕暈 暂暫 杀殺 杂雜 权權 条條 来來 杨楊 极極 构構 枪槍 枫楓 标標 栈棧 栋棟 树樹 样樣 桥橋 梦夢 检檢 欢歡 欧歐 毕畢 毙斃 气氣 汉漢 汤湯 沟溝 没沒 泪淚 泽澤 洁潔 浅淺 测測 济濟 浓濃 涛濤 涨漲 渊淵 温溫 湾灣 湿濕 满滿 滚滾 滞滯 灭滅 灯燈 灵靈 灾災 炉爐 点點 炼煉 烂爛 热熱 焕煥 爱愛 爷爺 牵牽 犹猶 狭狹 独獨 狮獅 猎獵 猪豬 猫貓 献獻 环環 现現 玛瑪 琐瑣 电電 画畫 畅暢 疗療 痒癢 睁睜 矿礦 码碼 砖磚 础礎 硕碩 确確 礼禮 祸禍 离離 秃禿 积積 称稱 稳穩 穷窮 窃竊 竞競 笔筆 笼籠 简簡 类類 粮糧 紧緊 纠糾 红紅 约約 级級 纪紀 纯純 纱紗 纲綱 纳納 纵縱 纷紛 纸紙 纹紋 线線 练練 组組 细細 织織 终終 绍紹 经經 结結 绕繞 绘繪 给給 络絡 绝絕 统統 继繼 绩績 绪緒 续續 维維 绵綿 综綜 绿綠 缓緩 编編 缘緣 缠纏 缩縮 罚罰 罗羅 职職 联聯 聪聰 肃肅 肠腸 肤膚 肿腫 胀脹 胁脅 脑腦 脚腳 脸臉 腾騰 舰艦 艺藝 节節 芦蘆 荣榮 莱萊 营營 萝蘿 虑慮 虫蟲 虽雖 蚀蝕 蛮蠻 补補 衬襯 袭襲 装裝 见見 观觀 规規 视視 览覽 觉覺 触觸 誉譽 计計 订訂 认認 讨討 让讓 训訓 议議 记記 讲講 许許 论論 设設 访訪 证證 评評 识識 诉訴 词詞 译譯 试試 诗詩 诚誠 话話 询詢 该該 详詳 语語 误誤 说說 请請 诸諸 读讀 课課 谁誰 调調 谈談 谊誼 谋謀 谎謊 谓謂 谢謝 谣謠 谱譜 贝貝 负負 贡貢 财財 责責 贤賢 败敗 货貨 质質 贩販 贫貧 购購 贯貫 贴貼 贵貴 贷貸 费費 贺賀 资資 赏賞 赐賜 赔賠 赖賴 赚賺 赛賽 赠贈 赵趙 赶趕 趋趨 跃躍 践踐 踪蹤 车車 轨軌 转轉 轮輪 软軟 轻輕 载載 较較 辆輛 辈輩 辉輝 输輸 辞辭 边邊 达達 迁遷 过過 运運 还還 这這 进進 远遠 违違 连連 迟遲 选選 递遞 逻邏 遗遺 邮郵 邻鄰 郑鄭 酱醬 释釋 针針 钓釣 钢鋼 钥鑰 钱錢 铁鐵 银銀 铺鋪 链鏈 销銷 锁鎖 锅鍋 错錯 键鍵 锻鍛 镇鎮 镜鏡 长長 门門 闪閃 闭閉 问問 闯闖 间間 闷悶 闹鬧 闻聞 阅閱 队隊 阳陽 阴陰 阵陣 阶階 际際 陆陸 陈陳 险險 随隨 隐隱 难難 雾霧 静靜 顶頂 项項 顺順 顽頑 顾顧 顿頓 预預 领領 频頻 题題 颜顏 额額 风風 飞飛 饭飯 饮飲 饰飾 饱飽 饿餓 馆館 马馬 驱驅 驶駛 驻駐 驾駕 验驗 骂罵 骑騎 骗騙 鱼魚 鲜鮮 鸟鳥 鸡雞 鸣鳴 麦麥 黄黃 齐齊 齿齒 龙龍 龟龜"
+).split()
+
+
+# (Simplified to Traditional, Traditional to Simplified) translate tables, built when conversion first runs
+@functools.lru_cache(maxsize=None)
+def chineseTables() -> Tuple[Dict[int, str], Dict[int, str]]:
+  simplified: str = "".join(pair[0] for pair in chinesePairs)
+  traditional: str = "".join(pair[1] for pair in chinesePairs)
+  return str.maketrans(simplified, traditional), str.maketrans(traditional, simplified)
+
+
+def simplifiedToTraditional(lines: Iterator[Tuple[int, str]], profile: SourceProfile) -> Iterator[Tuple[int, str]]:
+  table: Dict[int, str] = chineseTables()[0]
+  for index, line in lines:
+    yield index, line.translate(table)
+
+
+def traditionalToSimplified(lines: Iterator[Tuple[int, str]], profile: SourceProfile) -> Iterator[Tuple[int, str]]:
+  table: Dict[int, str] = chineseTables()[1]
+  for index, line in lines:
+    yield index, line.translate(table)
+
+
+# Remove ad and watermark lines of text source, such as site links
+def removeWatermarkLines(lines: Iterator[Tuple[int, str]], profile: SourceProfile) -> Iterator[Tuple[int, str]]:
+  for index, line in lines:
+    if not profile.watermarkPattern.search(line):
+      yield index, line
+
+
+# name: stage, stages run in the order they are given
+normalizeStages: Dict[str, NormalizeStage] = {
+  "blank": removeBlankLines,
+  "punctuation": normalizePunctuation,
+  "s2t": simplifiedToTraditional,
+  "t2s": traditionalToSimplified,
+  "watermark": removeWatermarkLines,
+}
+
+
+# Chain of normalization stages, lines are normalized lazily one by one while rendering
+class Normalizer:
+  def __init__(self, stageNames: List[str] = [], profile: SourceProfile = None):
+    for name in stageNames:
+      if name not in normalizeStages:
+        raise ValueError("Unknown normalization stage: %s" % name)
+    self.stageNames = list(stageNames)
+    self.profile = profile
+    # [lines yielded, seconds in stage and stages before it] of reading lines and every stage
+    self.totals: List[List[float]] = [[0, 0.0] for _ in range(len(self.stageNames) + 1)]
+
+  # Normalize (line index, line) pairs, lines are read only when the result is iterated
+  def run(self, lines: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+    if self.stageNames == []:
+      return iter(lines)
+    lines = self.__timed(self.totals[0], lines)
+    for number, name in enumerate(self.stageNames):
+      lines = self.__timed(self.totals[number + 1], normalizeStages[name](lines, self.profile))
+    return lines
+
+  # Count lines and time spent getting every line from stage
+  def __timed(self, totals: List[float], lines: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+    iterator: Iterator[Tuple[int, str]] = iter(lines)
+    while True:
+      startTime = time.perf_counter()
+      item = next(iterator, None)
+      totals[1] += time.perf_counter() - startTime
+      if item is None:
+        return
+      totals[0] += 1
+      yield item
+
+  # Add totals of a normalizer with same stages run in another process
+  def merge(self, totals: List[List[float]]):
+    for mergedTotals, (lineCount, seconds) in zip(self.totals, totals):
+      mergedTotals[0] += lineCount
+      mergedTotals[1] += seconds
+
+  # (name, lines in, lines out, seconds in stage itself) of every stage
+  def stageStats(self) -> List[Tuple[str, int, int, float]]:
+    return [(name, int(self.totals[number][0]), int(self.totals[number + 1][0]), max(0.0, self.totals[number + 1][1] - self.totals[number][1])) for number, name in enumerate(self.stageNames)]
@@ -0,0 +1,662 @@
+from book.cache import ConversionCache
+from book.chapter import Chapter, ChapterStatus
+from book.instrumentation import BookObserver
+from book.normalize import Normalizer
+from book.render import renderFileLines, renderLines
+from book.sources import RawTextType, SourceProfile, contentsLineCount, detectProfile, genericProfile, headerLineCount
+from book.text import TextLines, detectEncoding, readFile
+
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Set, Tuple
+import contextlib
+import functools
+import os
+import re
+import time
+import uuid
+
+# Imported when EPUB is written
+if TYPE_CHECKING:
+  from book.epubwriter import LazyEpubItem
+  from concurrent.futures import Executor
+  from ebooklib import epub
+
+
+# Report method as a stage to RawBook observer
+def observedStage(stage: str):
+  def decorator(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+      with self.stage(stage):
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+  return decorator
+
+
+class RawBook:
+  # Metadata
+  title: str = ""
+  author: str = ""
+  illustrator: str = ""
+  translator: str = ""
+  source: str = ""
+  language: str = "en-US"
+  subject: str = ""
+
+  # Raw text data
+  rawTextType: RawTextType = RawTextType.default
+  profile: SourceProfile = genericProfile
+  # Encoding of text file, detected when empty
+  encoding: str = ""
+  __textPath: str = ""
+  __textDirPath: str = ""
+  __rawTextLines: TextLines
+
+  # Book data
+  contentsIndex: int = 0
+  afterContentsIndex: int = 0
+  contents: List[Chapter]
+
+  # Illustration data
+  # illustrationPath: index
+  illustrations: Dict[str, int]
+  # illustrationPath: file written into EPUB, such as transcoded image
+  illustrationFiles: Dict[str, str]
+  illustrationPrefix: str = ""
+  illustrationSuffix: str = ""
+
+  # Chapter is split into XHTML files at line boundaries, every line is one paragraph, 0 is no limit
+  # Large XHTML files are slow to open on e-readers
+  maxSplitBytes: int = 100 * 1024
+  maxSplitLines: int = 0
+
+  # Worker processes rendering chapters of one book, 1 renders while writing in this process
+  renderJobs: int = 1
+  # Chapter files rendered in workers ahead of the writer, bounds memory of rendered chapters
+  renderAhead: int = 64
+
+  # XHTML and other text is deflated at compressLevel, already compressed images are stored when storeImages
+  compressLevel: int = 6
+  storeImages: bool = True
+  # Threads compressing EPUB entries while chapters are rendered
+  compressJobs: int = 1
+
+  # Names of normalization stages run on chapter lines before rendering, in order
+  normalization: List[str] = []
+  __normalizer: Normalizer
+
+  # Created when EPUB output is first needed, ebooklib and lxml are slow to import
+  __epub: "epub.EpubBook" = None
+
+  # Stage timings and counters are reported to observer
+  observer: BookObserver = None
+
+  def __init__(self, filePath: str, observer: BookObserver = None, encoding: str = ""):
+    self.reset()
+    self.observer = observer
+    self.__textPath = filePath
+    self.__textDirPath = os.path.dirname(self.__textPath)
+    with self.stage("detectEncoding"):
+      self.encoding = encoding if encoding != "" else detectEncoding(filePath)
+    # Map the raw text file, lines are decoded when accessed
+    with self.stage("read"):
+      self.__rawTextLines = TextLines(filePath, self.encoding)
+      self.initIllustrationsPath()
+    self.count("linesRead", len(self.__rawTextLines))
+
+    # Detect the source profile in header lines
+    with self.stage("detectType"):
+      self.profile = detectProfile(list(self.__rawTextLines[0:headerLineCount]))
+      self.rawTextType = self.profile.rawTextType
+
+    self.initMetadata()
+    self.illustrationPrefix = self.profile.illustrationPrefix
+    self.illustrationSuffix = self.profile.illustrationSuffix
+
+  def __enter__(self) -> "RawBook":
+    return self
+
+  def __exit__(self, *args):
+    self.reset()
+
+  # Time code block as a stage
+  @contextlib.contextmanager
+  def stage(self, stage: str):
+    if self.observer is None:
+      yield
+      return
+    self.observer.stageStarted(stage)
+    startTime = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observer.stageFinished(stage, time.perf_counter() - startTime)
+
+  def count(self, counter: str, value: int = 1):
+    if self.observer is not None:
+      self.observer.counted(counter, value)
+
+  def measure(self, gauge: str, value: float):
+    if self.observer is not None:
+      self.observer.measured(gauge, value)
+
+  # Release the raw text and clear all book data, every book owns its own data
+  def reset(self):
+    if hasattr(self, "_RawBook__rawTextLines"):
+      self.__rawTextLines.close()
+    self.__rawTextLines = TextLines()
+    self.encoding = ""
+
+    self.title = ""
+    self.author = ""
+    self.illustrator = ""
+    self.translator = ""
+    self.source = ""
+    self.language = RawBook.language
+    self.subject = ""
+
+    self.rawTextType = RawTextType.default
+    self.profile = genericProfile
+    self.__textPath = ""
+    self.__textDirPath = ""
+
+    self.contentsIndex = 0
+    self.afterContentsIndex = 0
+    self.contents = []
+
+    self.illustrations = {}
+    self.illustrationFiles = {}
+    self.illustrationPrefix = ""
+    self.illustrationSuffix = ""
+    self.maxSplitBytes = RawBook.maxSplitBytes
+    self.maxSplitLines = RawBook.maxSplitLines
+    self.renderJobs = RawBook.renderJobs
+    self.compressLevel = RawBook.compressLevel
+    self.storeImages = RawBook.storeImages
+    self.compressJobs = RawBook.compressJobs
+    self.normalization = []
+    self.__normalizer = Normalizer()
+
+    self.__epub = None
+
+  # Get metadata in different raw text type
+  @observedStage("initMetadata")
+  def initMetadata(self):
+    # Get metadata in header lines by source profile
+    for field, value in self.profile.metadata(list(self.__rawTextLines[0:headerLineCount])).items():
+      setattr(self, field, value)
+
+  # Get book contents
+  @observedStage("initContents")
+  def initContents(self):
+    # Find contents in first lines
+    index: int = 0
+    for line in self.__rawTextLines[0:contentsLineCount]:
+      index += 1
+      if self.profile.contentsPattern.search(line):
+        self.contentsIndex = index
+        break
+    else:
+      # Text without contents
+      self.detectContents()
+      return
+    # Get contents in following lines
+    while (not self.__rawTextLines[index].isspace()):
+      line: str = self.__rawTextLines[index]
+      # Set chapter level by count prefixed \t
+      level: int = line.count("\t") if line.startswith("\t") else 0
+      chapter = Chapter(line.strip(), level)
+      self.contents.append(chapter)
+      index += 1
+    self.afterContentsIndex = index
+
+  # Detect headings in one pass when text has no contents, chapters are located at the same time
+  def detectContents(self):
+    contents: List[Chapter] = []
+    hasVolume: bool = False
+    # Short lines are headings only after the first blank line, lines before are title and metadata
+    bodyStarted: bool = False
+    previousBlank: bool = False
+    # Short line after a blank line, it is a heading when next line is blank too
+    candidate: Chapter = None
+    for index, line in enumerate(self.__rawTextLines):
+      blank: bool = line.strip() == ""
+      if candidate is not None and blank:
+        contents.append(candidate)
+      candidate = None
+      if blank:
+        bodyStarted = True
+        previousBlank = True
+        continue
+
+      level: int = self.profile.headingLevel(line)
+      if level >= 0:
+        contents.append(Chapter(line.strip(), level, index))
+        hasVolume = hasVolume or level == 0
+      elif bodyStarted and previousBlank and self.profile.isShortHeading(line):
+        candidate = Chapter(line.strip(), 1, index)
+      previousBlank = False
+    # End of text is blank
+    if candidate is not None:
+      contents.append(candidate)
+
+    # Chapters are under volumes only when the text has volumes
+    for chapter in contents:
+      if not hasVolume:
+        chapter.level = 0
+      self.setChapterIndex(chapter, chapter.index)
+      chapter.status = ChapterStatus.found
+    self.contents = contents
+    self.contentsIndex = 0
+    self.afterContentsIndex = 0
+    self.count("headingsDetected", len(contents))
+
+  # Find all chapters location
+  @observedStage("initChaptersIndex")
+  def initChaptersIndex(self):
+    # Chapters located by heading detection are kept
+    chapters: List[Chapter] = [chapter for chapter in self.contents if chapter.status == ChapterStatus.unknown]
+    indexes: List[int] = self.findLines(self.afterContentsIndex, [chapter.string for chapter in chapters])
+    for chapter, index in zip(chapters, indexes):
+      self.setChapterIndex(chapter, index)
+    self.updateChaptersStatus()
+
+  # Set status of all chapters by their location, chapter before its previous chapter is out of order
+  def updateChaptersStatus(self):
+    lastIndex: int = -1
+    for chapter in self.contents:
+      if chapter.index < 0:
+        chapter.status = ChapterStatus.notFound
+      elif chapter.index < lastIndex:
+        chapter.status = ChapterStatus.outOfOrder
+      else:
+        chapter.status = ChapterStatus.found
+        lastIndex = chapter.index
+    self.measure("unmatchedChapters", len([chapter for chapter in self.contents if chapter.index < 0]))
+
+  # Locate chapters of numbers again between their unchanged neighbors, other chapters keep their location
+  def relocateChapters(self, changed: List[int]):
+    if changed == []:
+      return
+
+    # Next unchanged chapter location is the end of search
+    endIndexes: List[int] = [len(self.__rawTextLines)] * len(self.contents)
+    endIndex: int = len(self.__rawTextLines)
+    changedSet: Set[int] = set(changed)
+    for number in range(len(self.contents) - 1, -1, -1):
+      endIndexes[number] = endIndex
+      if number not in changedSet and self.contents[number].index >= 0:
+        endIndex = self.contents[number].index
+
+    # Locate changed chapters after previous chapter
+    startIndex: int = self.afterContentsIndex
+    outOfBounds: List[Chapter] = []
+    for number, chapter in enumerate(self.contents):
+      if number in changedSet:
+        index: int = self.findLine(startIndex, chapter.string, endIndex=endIndexes[number])
+        if index < 0:
+          outOfBounds.append(chapter)
+          continue
+        self.setChapterIndex(chapter, index)
+        chapter.status = ChapterStatus.found
+      if chapter.index >= startIndex:
+        startIndex = chapter.index
+
+    # Chapter not between its neighbors may be anywhere else
+    for chapter in outOfBounds:
+      index: int = self.findLine(self.afterContentsIndex, chapter.string)
+      self.setChapterIndex(chapter, index)
+      chapter.status = ChapterStatus.outOfOrder if index >= 0 else ChapterStatus.notFound
+    self.count("chaptersRelocated", len(changed))
+    self.measure("unmatchedChapters", len([chapter for chapter in self.contents if chapter.index < 0]))
+
+  # Location and status chapter of number would have with string, chapter is not changed
+  # Searched between its located neighbors like relocateChapters, then anywhere else, status is shown while editing
+  def previewChapter(self, number: int, string: str) -> Tuple[int, ChapterStatus]:
+    string = string.strip()
+    if string == "":
+      return -1, ChapterStatus.notFound
+    startIndex: int = max([chapter.index for chapter in self.contents[:number]] + [self.afterContentsIndex])
+    endIndex: int = next((chapter.index for chapter in self.contents[number + 1:] if chapter.index >= 0), len(self.__rawTextLines))
+    index: int = self.findLine(startIndex, string, endIndex=endIndex)
+    if index >= 0:
+      return index, ChapterStatus.found
+    index = self.findLine(self.afterContentsIndex, string)
+    return index, ChapterStatus.outOfOrder if index >= 0 else ChapterStatus.notFound
+
+  # Set chapter location
+  def setChapterIndex(self, chapter: Chapter, index: int):
+    chapter.index = index
+    chapter.illustration = False
+    # TSDM/LK chapter may has title illustration
+    if self.profile.titleIllustration:
+      if chapter.index > 0 and self.__rawTextLines[chapter.index - 1].strip() != "":
+        chapter.illustration = True
+
+  # EPUB being built, created on first use
+  def __epubBook(self) -> "epub.EpubBook":
+    if self.__epub is None:
+      from ebooklib import epub
+      self.__epub = epub.EpubBook()
+    return self.__epub
+
+  # Set EPUB metadata on a new EPUB, metadata of earlier saves is dropped
+  def initEpub(self):
+    self.__epub = None
+    self.__epubBook()
+    # Use metadata and contents to generate UUID as EPUB identifier
+    self.__epub.set_identifier(str(uuid.uuid5(uuid.NAMESPACE_URL, self.title + self.author + self.illustrator + self.translator + self.source + self.language + self.subject + self.getContents() + "simplepub.py")))
+
+    # Set EPUB metadata
+    if self.title != "":
+      self.__epub.set_title(self.title)
+    if self.author != "":
+      self.__epub.add_author(self.author)
+    if self.illustrator != "":
+      self.__epub.add_metadata("DC", "contributor", self.illustrator, {"name": "opf:role", "content": "ill"})
+    if self.translator != "":
+      self.__epub.add_metadata("DC", "contributor", self.translator, {"name": "opf:role", "content": "trl"})
+    if self.source != "":
+      self.__epub.set_unique_metadata("DC", "source", self.source)
+    if self.language != "":
+      self.__epub.set_language(self.language)
+    if self.subject != "":
+      self.__epub.set_unique_metadata("DC", "subject", self.subject)
+    self.__epub.set_unique_metadata(None, "meta", "", {"name": "Tool", "content": "simplepub.py"})
+
+  # Write EPUB file, chapters are rendered one by one while writing, or reused from cache
+  @observedStage("writeEpub")
+  def writeEpub(self, filePath: str, chapterCache: ConversionCache = None):
+    from book.epubwriter import LazyEpubItem, PackageWriter
+    from ebooklib import epub
+
+    self.__epubBook()
+    self.__normalizer = Normalizer(self.normalization, self.profile)
+    # Chapters as shown in headings and TOC, titles are normalized like lines, title removed as a line is kept
+    titles: Dict[int, str] = dict(Normalizer(self.normalization, self.profile).run((number, chapter.string) for number, chapter in enumerate(self.contents)))
+    headings: List[Chapter] = [Chapter(titles.get(number, chapter.string), chapter.level, chapter.index) for number, chapter in enumerate(self.contents)]
+    self.__epub.items = []
+    self.__epub.spine = []
+    self.__epub.toc = []
+    self.__epub.add_item(epub.EpubNcx())
+    self.__epub.add_item(epub.EpubNav())
+    self.__epub.spine.append("nav")
+
+    # lineIndex: illustration paths in EPUB
+    illustrationLines: Dict[int, List[str]] = {}
+    # illustration file: path in EPUB, same file is added once
+    imageFileNames: Dict[str, str] = {}
+    for number, (illustration, index) in enumerate(self.illustrations.items()):
+      if index < 0:
+        continue
+      illustrationFile: str = self.illustrationFiles.get(illustration, illustration)
+      if illustrationFile not in imageFileNames:
+        name, extension = os.path.splitext(os.path.basename(illustration))[0], os.path.splitext(illustrationFile)[1]
+        # Images with same name may have same extension after transcoding
+        if "Images/" + name + extension in imageFileNames.values():
+          name += "_%d" % number
+        imageFileNames[illustrationFile] = "Images/" + name + extension
+        self.__epub.add_item(LazyEpubItem("image%04d" % number, imageFileNames[illustrationFile], "", functools.partial(readFile, illustrationFile)))
+      illustrationLines.setdefault(index, []).append(imageFileNames[illustrationFile])
+
+    # Split text into chapter files in text order, chapters on the same line share one file
+    chapterIndexes: List[int] = sorted(set(chapter.index for chapter in self.contents if chapter.index >= 0))
+    startIndexes: List[int] = []
+    for index in chapterIndexes:
+      # Move title illustration into its chapter
+      if index - 1 in illustrationLines and (startIndexes == [] or index - 1 > startIndexes[-1]):
+        index -= 1
+      startIndexes.append(index)
+    startIndexes.append(len(self.__rawTextLines))
+
+    # (item id, chapters, start index, end index) of every file before splitting, in text order
+    documents: List[Tuple[str, List[Chapter], int, int]] = []
+    # Lines before first chapter, such as cover illustration and preface, are in a file without heading
+    frontEndIndex: int = startIndexes[0]
+    if frontEndIndex > self.afterContentsIndex and (any(self.afterContentsIndex <= index < frontEndIndex for index in illustrationLines) or any(line.strip() != "" for line in self.__rawTextLines[self.afterContentsIndex:frontEndIndex])):
+      documents.append(("front", [], self.afterContentsIndex, frontEndIndex))
+    for number, index in enumerate(chapterIndexes):
+      documents.append(("chapter%04d" % number, [chapter for chapter in headings if chapter.index == index], startIndexes[number], startIndexes[number + 1]))
+
+    # TOC links to first file of chapter
+    fileNames: Dict[int, str] = {}
+    splitCount: int = 0
+    # (item, chapters, start index, end index) in spine order
+    parts: List[Tuple[LazyEpubItem, List[Chapter], int, int]] = []
+    for documentId, chapters, startIndex, endIndex in documents:
+      if chapters != []:
+        fileNames[chapters[0].index] = "Text/%s.xhtml" % documentId
+      # Illustrations are rendered in the file containing their line
+      splitIndexes: List[int] = self.__rawTextLines.split(startIndex, endIndex, self.maxSplitBytes, self.maxSplitLines) + [endIndex]
+      splitCount += len(splitIndexes) - 2
+      for part in range(len(splitIndexes) - 1):
+        itemId: str = documentId if part == 0 else "%s_%d" % (documentId, part)
+        fileName: str = "Text/%s.xhtml" % itemId
+        render = functools.partial(self.renderChapter, chapters, splitIndexes[part], splitIndexes[part + 1], illustrationLines)
+        if chapterCache is not None:
+          render = functools.partial(self.renderCachedChapter, chapterCache, chapters, splitIndexes[part], splitIndexes[part + 1], illustrationLines)
+        item = self.__epub.add_item(LazyEpubItem(itemId, fileName, "application/xhtml+xml", render))
+        self.__epub.spine.append(item)
+        parts.append((item, chapters, splitIndexes[part], splitIndexes[part + 1]))
+
+    # Build TOC by chapter level
+    # (chapter number, children)
+    toc: List[Tuple[int, list]] = []
+    # (level, children) of current parents
+    parents: List[Tuple[int, list]] = [(-1, toc)]
+    for number, chapter in enumerate(headings):
+      if chapter.index < 0:
+        continue
+      while parents[-1][0] >= chapter.level:
+        parents.pop()
+      children: List[Tuple[int, list]] = []
+      parents[-1][1].append((number, children))
+      parents.append((chapter.level, children))
+
+    def tocEntry(number: int, children: List[Tuple[int, list]]):
+      chapter: Chapter = headings[number]
+      if children == []:
+        return epub.Link(fileNames[chapter.index], chapter.string, "toc%d" % number)
+      return (epub.Section(chapter.string, fileNames[chapter.index]), [tocEntry(*child) for child in children])
+
+    self.__epub.toc = [tocEntry(*entry) for entry in toc]
+
+    writer = PackageWriter(filePath, self.__epub, {"epub3_pages": False}, self.compressLevel, self.storeImages, self.compressJobs)
+    writer.process()
+    if self.renderJobs > 1 and len(parts) > 1:
+      # Starting processes is slower than importing, only imported when chapters are rendered in parallel
+      from concurrent.futures import ProcessPoolExecutor
+      with ProcessPoolExecutor(max_workers=min(self.renderJobs, len(parts))) as executor:
+        self.__renderInParallel(executor, parts, illustrationLines, chapterCache)
+        writer.write()
+    else:
+      writer.write()
+    self.count("chaptersWritten", len(chapterIndexes))
+    self.count("chapterSplits", splitCount)
+    for name, linesIn, linesOut, seconds in self.__normalizer.stageStats():
+      self.count("normalize.%s.lines" % name, linesIn)
+      self.count("normalize.%s.removed" % name, linesIn - linesOut)
+      self.measure("normalize.%s.seconds" % name, seconds)
+      self.measure("normalize.%s.linesPerSecond" % name, linesIn / seconds if seconds > 0 else 0.0)
+    self.count("bytesWritten", os.path.getsize(filePath))
+    self.count("bytesStored", writer.storedBytes)
+    self.count("bytesDeflated", writer.deflatedBytes)
+    self.measure("compressSeconds", writer.compressSeconds)
+
+  # Render chapter parts in worker processes while the writer writes them in spine order
+  # Parts are submitted when the writer reaches renderAhead parts before them
+  def __renderInParallel(self, executor: "Executor", parts: List[Tuple["LazyEpubItem", List[Chapter], int, int]], illustrationLines: Dict[int, List[str]], chapterCache: ConversionCache = None):
+    # part number: rendered content
+    results: Dict[int, Callable[[], bytes]] = {}
+    submittedCount: int = 0
+
+    def renderPart(number: int) -> bytes:
+      nonlocal submittedCount
+      while submittedCount < min(len(parts), number + self.renderAhead):
+        results[submittedCount] = self.__submitChapter(executor, chapterCache, *parts[submittedCount][1:], illustrationLines)
+        submittedCount += 1
+      # Content is released once written, render again if asked twice
+      result = results.pop(number, None)
+      if result is None:
+        return self.renderChapter(*parts[number][1:], illustrationLines)
+      return result()
+
+    for number, (item, _, _, _) in enumerate(parts):
+      item.render = functools.partial(renderPart, number)
+
+  # Render chapter in worker process, workers only get the location of its lines
+  # Cached chapter is not submitted, rendered chapter is cached when its result is read
+  def __submitChapter(self, executor: "Executor", chapterCache: ConversionCache, chapters: List[Chapter], startIndex: int, endIndex: int, illustrationLines: Dict[int, List[str]]) -> Callable[[], bytes]:
+    key: str = ""
+    if chapterCache is not None:
+      key = self.__chapterKey(chapterCache, chapters, startIndex, endIndex, illustrationLines)
+      content = chapterCache.getChapter(key)
+      if content is not None:
+        self.count("chapterCacheHits")
+        return lambda: content
+    partIllustrationLines: Dict[int, List[str]] = {index: fileNames for index, fileNames in illustrationLines.items() if startIndex <= index < endIndex}
+    future = executor.submit(renderFileLines, *self.__rawTextLines.source(startIndex, endIndex), startIndex, endIndex, chapters, partIllustrationLines, self.language, self.__normalizer.stageNames, self.profile)
+
+    def result() -> bytes:
+      content, normalizerTotals = future.result()
+      self.__normalizer.merge(normalizerTotals)
+      if chapterCache is not None:
+        chapterCache.putChapter(key, content)
+      return content
+
+    return result
+
+  # Cache key of chapter rendered from lines in [startIndex, endIndex)
+  def __chapterKey(self, chapterCache: ConversionCache, chapters: List[Chapter], startIndex: int, endIndex: int, illustrationLines: Dict[int, List[str]]) -> str:
+    # Locations are relative to chapter start
+    chaptersKey: str = repr([(chapter.string, chapter.level, chapter.index - startIndex) for chapter in chapters])
+    illustrationsKey: str = repr(sorted((index - startIndex, fileNames) for index, fileNames in illustrationLines.items() if startIndex <= index < endIndex))
+    normalizationKey: str = repr(self.__normalizer.stageNames) + (self.profile.watermarkPattern.pattern if "watermark" in self.__normalizer.stageNames else "")
+    return chapterCache.key(self.__rawTextLines.rawBytes(startIndex, endIndex), self.language, chaptersKey, illustrationsKey, normalizationKey)
+
+  # Render chapter, XHTML rendered from same lines and chapters before is reused
+  def renderCachedChapter(self, chapterCache: ConversionCache, chapters: List[Chapter], startIndex: int, endIndex: int, illustrationLines: Dict[int, List[str]]) -> bytes:
+    key: str = self.__chapterKey(chapterCache, chapters, startIndex, endIndex, illustrationLines)
+    content = chapterCache.getChapter(key)
+    if content is None:
+      content = self.renderChapter(chapters, startIndex, endIndex, illustrationLines)
+      chapterCache.putChapter(key, content)
+    else:
+      self.count("chapterCacheHits")
+    return content
+
+  # Render lines in [startIndex, endIndex) to XHTML
+  def renderChapter(self, chapters: List[Chapter], startIndex: int, endIndex: int, illustrationLines: Dict[int, List[str]]) -> bytes:
+    return renderLines(self.__normalizer.run(enumerate(self.__rawTextLines[startIndex:endIndex], startIndex)), startIndex, endIndex, chapters, illustrationLines, self.language)
+
+  # Get all image in text directory
+  def initIllustrationsPath(self):
+    for illustration in listIllustrationsPath(self.__textDirPath):
+      self.illustrations[illustration] = -1
+
+  # Get contents as string, chapter level as prefixed \t
+  def getContents(self) -> str:
+    return "\n".join("\t" * chapter.level + chapter.string for chapter in self.contents)
+
+  # Set contents by string
+  @observedStage("setContents")
+  def setContents(self, rawContents: str):
+    contents: List[Chapter] = []
+    # Set chapter level by count prefixed \t
+    for line in rawContents.splitlines():
+      level: int = line.count("\t") if line.startswith("\t") else 0
+      contents.append(Chapter(line.strip(), level))
+    self.contents = contents
+
+  # Find all image location
+  @observedStage("findIllustrationsIndex")
+  def findIllustrationsIndex(self, prefix: str = "", suffix: str = ""):
+    illustrationNames: List[str] = [os.path.basename(os.path.splitext(illustration)[0]) for illustration in self.illustrations]
+    indexes: List[int] = self.findLines(0, illustrationNames, prefix, suffix)
+    for illustration, index in zip(list(self.illustrations), indexes):
+      self.illustrations[illustration] = index
+
+  # Find fist line in all lines, or before endIndex
+  def findLine(self, startIndex: int, substring: str, prefix: str = "", suffix: str = "", endIndex: int = None) -> int:
+    self.count("findLineCalls")
+    # Substring in one line can be searched in whole text
+    if prefix == "" and suffix == "" and not any(lineBreak in substring for lineBreak in TextLines.lineBreaks):
+      index = self.__rawTextLines.find(substring, startIndex, endIndex)
+      scannedEndIndex: int = index + 1 if index >= 0 else len(self.__rawTextLines[:endIndex])
+      self.count("linesScanned", max(0, scannedEndIndex - startIndex))
+      return index
+    index = startIndex
+    for line in self.__rawTextLines[startIndex:endIndex]:
+      if substring in line and line.startswith(prefix) and line.endswith(suffix):
+        self.count("linesScanned", index + 1 - startIndex)
+        return index
+      index += 1
+    self.count("linesScanned", index - startIndex)
+    return -1
+
+  # Find fist line of every substring in one pass, same result as calling findLine for each substring
+  def findLines(self, startIndex: int, substrings: Iterable[str], prefix: str = "", suffix: str = "") -> List[int]:
+    substrings = list(substrings)
+    indexes: List[int] = [-1] * len(substrings)
+    # substring: positions in substrings, duplicated substrings share one search
+    pending: Dict[str, List[int]] = {}
+    for position, substring in enumerate(substrings):
+      pending.setdefault(substring, []).append(position)
+    if pending == {}:
+      return indexes
+
+    # A line can only contain a pending substring if the combined pattern matches it
+    self.count("findLinesCalls")
+    pattern = re.compile(trieRegex(pending))
+    patternSize: int = len(pending)
+    index = startIndex
+    for line in self.__rawTextLines[startIndex:]:
+      if line.startswith(prefix) and line.endswith(suffix) and pattern.search(line):
+        for substring in [substring for substring in pending if substring in line]:
+          for position in pending.pop(substring):
+            indexes[position] = index
+        if pending == {}:
+          index += 1
+          break
+        # Drop found substrings from the pattern once half of them are found
+        if len(pending) * 2 <= patternSize:
+          pattern = re.compile(trieRegex(pending))
+          patternSize = len(pending)
+      index += 1
+    self.count("linesScanned", max(0, index - startIndex))
+    return indexes
+
+
+# Strings are put into the trie up to this length, nesting of the regex grows with string length
+# Longer strings and chapter titles would exceed recursion limits of nodeRegex and the regex compiler
+maxTriePrefix: int = 48
+
+
+# Build a regex matching any of the strings, sharing common prefixes like a trie
+# Only first maxTriePrefix characters are matched, matched lines must still be checked for the whole strings
+def trieRegex(strings: Iterable[str]) -> str:
+  trie: Dict[str, dict] = {}
+  for string in strings:
+    node = trie
+    for char in string[:maxTriePrefix]:
+      node = node.setdefault(char, {})
+    node[""] = {}
+
+  def nodeRegex(node: Dict[str, dict]) -> str:
+    branches: List[str] = [re.escape(char) + nodeRegex(child) for char, child in sorted(node.items()) if char != ""]
+    if branches == []:
+      return ""
+    regex: str = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    # Strings ending here make the rest optional
+    if "" in node:
+      regex = "(?:" + regex + ")?"
+    return regex
+
+  return nodeRegex(trie)
+
+
+# Get all image path in directory
+def listIllustrationsPath(dirPath: str) -> List[str]:
+  subFilePaths: List[str] = os.listdir(dirPath)
+  return [dirPath + "/" + filePath for filePath in subFilePaths if filePath.endswith(".png") or filePath.endswith(".webp") or filePath.endswith(".jpg")]
@@ -0,0 +1,58 @@
+from book.chapter import Chapter
+from book.normalize import Normalizer
+from book.sources import SourceProfile
+
+from typing import Dict, Iterable, List, Tuple
+import html
+import os
+
+
+# Render (line index, line) pairs of lines in [startIndex, endIndex) to XHTML
+# chapters share the heading line, illustrationLines maps line index to illustration paths in EPUB
+# Headings and illustrations are rendered at their lines even if normalization removed the lines
+# Lines before first chapter are rendered without chapters and heading
+def renderLines(lines: Iterable[Tuple[int, str]], startIndex: int, endIndex: int, chapters: List[Chapter], illustrationLines: Dict[int, List[str]], language: str) -> bytes:
+  title: str = html.escape(chapters[0].string) if chapters != [] else ""
+  language = html.escape(language)
+  markerIndexes: List[int] = sorted(set([index for index in illustrationLines if startIndex <= index < endIndex] + ([chapters[0].index] if chapters != [] and startIndex <= chapters[0].index < endIndex else [])))
+  body: List[str] = []
+
+  def renderMarker(index: int):
+    if index in illustrationLines:
+      for fileName in illustrationLines[index]:
+        body.append('<div class="illustration"><img src="../%s" alt="%s"/></div>' % (html.escape(fileName), html.escape(os.path.basename(fileName))))
+    else:
+      for chapter in chapters:
+        level = min(chapter.level + 1, 6)
+        body.append("<h%d>%s</h%d>" % (level, html.escape(chapter.string), level))
+
+  markerNumber: int = 0
+  for index, line in lines:
+    while markerNumber < len(markerIndexes) and markerIndexes[markerNumber] <= index:
+      renderMarker(markerIndexes[markerNumber])
+      markerNumber += 1
+    if markerNumber > 0 and markerIndexes[markerNumber - 1] == index:
+      continue
+    if line.strip() != "":
+      body.append("<p>%s</p>" % html.escape(line.strip()))
+  for index in markerIndexes[markerNumber:]:
+    renderMarker(index)
+
+  return ('<?xml version="1.0" encoding="utf-8"?>\n'
+          '<!DOCTYPE html>\n'
+          '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="%s" xml:lang="%s">\n'
+          '<head>\n<title>%s</title>\n</head>\n'
+          '<body>\n%s\n</body>\n'
+          '</html>\n' % (language, language, title, "\n".join(body))).encode("utf-8")
+
+
+# Render lines in worker process, lines are read from byte range of UTF-8 file, or given as encoded data when file is empty
+# Return XHTML and normalizer totals of the lines
+def renderFileLines(filePath: str, startOffset: int, endOffset: int, data: bytes, startIndex: int, endIndex: int, chapters: List[Chapter], illustrationLines: Dict[int, List[str]], language: str, normalization: List[str], profile: SourceProfile) -> Tuple[bytes, List[List[float]]]:
+  if filePath != "":
+    with open(filePath, "rb") as file:
+      file.seek(startOffset)
+      data = file.read(endOffset - startOffset)
+  normalizer = Normalizer(normalization, profile)
+  content: bytes = renderLines(normalizer.run(enumerate(data.decode("utf-8").splitlines(), startIndex)), startIndex, endIndex, chapters, illustrationLines, language)
+  return content, normalizer.totals
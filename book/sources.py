@@ -0,0 +1,145 @@
+from enum import Enum
+from typing import Dict, List, Pattern
+import re
+
+
+# Identify book text type for parsing
+class RawTextType(Enum):
+  default: int = 0
+  tsdm: int = 1
+  lk: int = 2
+  wenku8: int = 3
+  esj: int = 4
+
+
+# Lines at start of text searched for source and metadata
+headerLineCount: int = 20
+# Lines at start of text searched for contents
+contentsLineCount: int = 100
+
+# Chinese and Arabic numbers in headings
+numberPattern: str = r"[0-9０-９零〇一二兩两三四五六七八九十百千]+"
+# Heading ends at line end or a separator before its title
+headingEndPattern: str = r"(?:$|[\s:：·・\-—])"
+# Volume heading, such as "第一卷"
+volumeHeadingPattern: str = r"^\s*(?:第" + numberPattern + r"[卷部集冊册]|[上中下]卷|Vol(?:ume|\.)\s*\d+)" + headingEndPattern
+# Chapter heading, such as "第一章", "後記" or numbered "1. title"
+chapterHeadingPattern: str = (r"^\s*(?:第" + numberPattern + r"[章話话節节回幕]|序章|序幕|序言|楔子|終章|终章|尾聲|尾声|後記|后记|番外|插話|插话|間章|间章|幕間|幕间|外傳|外传|Prologue|Epilogue|Afterword|Chapter\s*\d+)" + headingEndPattern
+                       + r"|^(?:[0-9０-９]{1,3}|[一二三四五六七八九十]{1,3})\s*[\.、．](?![0-9０-９])\s*\S")
+# Sentence end of body text, short line ending with it is not a heading
+sentenceEndingPattern: str = r"[。，、！？…」』”）)!?,]$"
+# Ad and watermark line, such as site link or "本書由...整理"
+watermarkLinePattern: str = (r"https?://|www\.[\w-]+\.\w|本[書书]由.{0,20}(?:整理|製作|制作|提供)|更多.{0,20}[請请].{0,10}(?:訪問|访问|登入|登录|關注|关注)"
+                             r"|(?:天使動漫|天使动漫|輕之國度|轻之国度|輕小說文庫|轻小说文库).{0,20}(?:首發|首发|論壇|论坛|下載|下载)")
+
+
+# Parsing rules of a text source, all patterns are compiled once
+class SourceProfile:
+  rawTextType: RawTextType = RawTextType.default
+  # Searched in header, None matches every text
+  detectPattern: Pattern = None
+  # field: pattern searched in header lines, group "value" is the field value
+  metadataPatterns: Dict[str, Pattern]
+  # Use first non-blank header line as title
+  titleFromHeader: bool = False
+  # Fixed metadata, empty keeps book default
+  source: str = ""
+  language: str = ""
+  subject: str = ""
+  # Searched in first lines, contents start after the matched line
+  contentsPattern: Pattern = re.compile("CONTENTS")
+  # Illustration line is prefix + image name + suffix
+  illustrationPrefix: str = ""
+  illustrationSuffix: str = ""
+  # Non-blank line right before chapter title is its illustration
+  titleIllustration: bool = False
+  # Line removed by watermark normalization
+  watermarkPattern: Pattern = re.compile(watermarkLinePattern, re.IGNORECASE)
+  # Headings detected when text has no contents
+  volumePattern: Pattern = re.compile(volumeHeadingPattern, re.IGNORECASE)
+  chapterPattern: Pattern = re.compile(chapterHeadingPattern, re.IGNORECASE)
+  sentenceEndPattern: Pattern = re.compile(sentenceEndingPattern)
+  # Longer line is not a heading, short line between blank lines is a heading
+  maxHeadingLength: int = 40
+  maxShortHeadingLength: int = 20
+
+  def __init__(self, rawTextType: RawTextType, detectPattern: str = None, metadataPatterns: Dict[str, str] = {}, titleFromHeader: bool = False, source: str = "", language: str = "", subject: str = "", contentsPattern: str = "CONTENTS", illustrationPrefix: str = "", illustrationSuffix: str = "", titleIllustration: bool = False, watermarkPattern: str = watermarkLinePattern):
+    self.rawTextType = rawTextType
+    self.detectPattern = re.compile(detectPattern, re.IGNORECASE) if detectPattern is not None else None
+    self.metadataPatterns = {field: re.compile(pattern) for field, pattern in metadataPatterns.items()}
+    self.titleFromHeader = titleFromHeader
+    self.source = source
+    self.language = language
+    self.subject = subject
+    self.contentsPattern = re.compile(contentsPattern)
+    self.illustrationPrefix = illustrationPrefix
+    self.illustrationSuffix = illustrationSuffix
+    self.titleIllustration = titleIllustration
+    self.watermarkPattern = re.compile(watermarkPattern, re.IGNORECASE)
+
+  # 0 for volume heading, 1 for chapter heading, -1 for other line
+  def headingLevel(self, line: str) -> int:
+    if len(line.strip()) > self.maxHeadingLength:
+      return -1
+    if self.volumePattern.match(line):
+      return 0
+    if self.chapterPattern.match(line):
+      return 1
+    return -1
+
+  # Short unindented line that is not a sentence, a heading if it is between blank lines
+  def isShortHeading(self, line: str) -> bool:
+    return 0 < len(line) <= self.maxShortHeadingLength and not line[0].isspace() and self.sentenceEndPattern.search(line.rstrip()) is None and re.search(r"\w", line) is not None
+
+  def detect(self, header: str) -> bool:
+    return self.detectPattern is None or self.detectPattern.search(header) is not None
+
+  # Metadata found in header lines, first match of every field is used
+  def metadata(self, headerLines: List[str]) -> Dict[str, str]:
+    metadata: Dict[str, str] = {}
+    for field in ("source", "language", "subject"):
+      if getattr(self, field) != "":
+        metadata[field] = getattr(self, field)
+    if self.titleFromHeader:
+      for line in headerLines:
+        if line.strip() != "":
+          metadata["title"] = line.strip()
+          break
+    for line in headerLines:
+      for field, pattern in self.metadataPatterns.items():
+        if field not in metadata:
+          match = pattern.search(line)
+          if match:
+            metadata[field] = match.group("value").strip()
+    return metadata
+
+
+# Chinese metadata lines, such as "作者：name"
+chineseMetadataPatterns: Dict[str, str] = {
+  "author": r"(?:作者|作者)\s*[：:]\s*(?P<value>.+)",
+  "illustrator": r"(?:插畫|插画)\s*[：:]\s*(?P<value>.+)",
+  "translator": r"(?:譯者|译者)\s*[：:]\s*(?P<value>.+)",
+}
+
+tsdmProfile = SourceProfile(RawTextType.tsdm, "tsdm", chineseMetadataPatterns, True, "天使動漫", "zh-TW", "輕小説", illustrationPrefix="　　（", illustrationSuffix="）", titleIllustration=True)
+lkProfile = SourceProfile(RawTextType.lk, "lightnovel", chineseMetadataPatterns, True, "輕之國度", "zh-TW", "輕小説", illustrationPrefix="　　（", illustrationSuffix="）", titleIllustration=True)
+wenku8Profile = SourceProfile(RawTextType.wenku8, "wenku8", chineseMetadataPatterns, True, "輕小說文庫", "zh-CN", "輕小説", r"CONTENTS|^\s*目[录錄]\s*$")
+esjProfile = SourceProfile(RawTextType.esj, "esjzone", chineseMetadataPatterns, True, "ESJ Zone", "zh-TW", "輕小説", r"CONTENTS|^\s*目[录錄]\s*$")
+genericProfile = SourceProfile(RawTextType.default)
+
+# Detected in order, generic profile matches every text and stays last
+sourceProfiles: List[SourceProfile] = [tsdmProfile, lkProfile, wenku8Profile, esjProfile, genericProfile]
+
+
+# Add profile detected before generic profile
+def registerProfile(profile: SourceProfile):
+  sourceProfiles.insert(len(sourceProfiles) - 1, profile)
+
+
+# First profile matching header lines
+def detectProfile(headerLines: List[str]) -> SourceProfile:
+  header: str = "\n".join(headerLines)
+  for profile in sourceProfiles:
+    if profile.detect(header):
+      return profile
+  return genericProfile
@@ -0,0 +1,191 @@
+from array import array
+from typing import Dict, Iterator, List, Set, Tuple, Union
+import bisect
+import codecs
+import itertools
+import mmap
+import os
+import re
+import tempfile
+
+
+# Lines of a UTF-8 text file, decoded only when accessed
+class TextLines:
+  # Same line boundaries as str.splitlines, rare line breaks are only searched when the text has them
+  lineBreakPattern = re.compile(rb"\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+  commonLineBreakPattern = re.compile(rb"\r\n?|\n")
+  newLinePattern = re.compile(rb"\n")
+  carriageReturnPattern = re.compile(rb"\r(?!\n)")
+  rareLineBreaks: Tuple[bytes, ...] = (b"\x0b", b"\x0c", b"\x1c", b"\x1d", b"\x1e", b"\xc2\x85", b"\xe2\x80\xa8", b"\xe2\x80\xa9")
+  lineBreaks: Tuple[str, ...] = ("\r\n", "\n", "\r", "\x0b", "\x0c", "\x1c", "\x1d", "\x1e", "\x85", "\u2028", "\u2029")
+  # Lines decoded at once when iterating
+  chunkSize: int = 1024
+
+  # Bytes decoded at once when the text is not UTF-8
+  decodeChunkSize: int = 1 << 20
+
+  def __init__(self, filePath: str = "", encoding: str = "utf-8"):
+    if filePath == "" or codecs.lookup(encoding).name in ("utf-8", "utf-8-sig"):
+      self.__mapFile(filePath)
+    else:
+      self.__decodeFile(filePath, encoding)
+    if self.__offsets[-1] != len(self.__data):
+      self.__offsets.append(len(self.__data))
+    # Line numbers in this view
+    self.__lineNumbers = range(len(self.__offsets) - 1)
+
+  # Map UTF-8 file directly
+  def __mapFile(self, filePath: str):
+    # No lines without file
+    self.__file = open(filePath, "rb") if filePath != "" else None
+    self.__filePath = filePath
+    size: int = os.fstat(self.__file.fileno()).st_size if self.__file else 0
+    self.__data = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b""
+    # Skip BOM
+    start: int = 3 if self.__data[0:3] == codecs.BOM_UTF8 else 0
+    # Start offset of every line, and end offset of the last line
+    self.__offsets = array("Q", [start])
+    pattern = self.newLinePattern
+    if self.carriageReturnPattern.search(self.__data, start):
+      pattern = self.commonLineBreakPattern
+    if any(self.__data.find(lineBreak, start) >= 0 for lineBreak in self.rareLineBreaks):
+      pattern = self.lineBreakPattern
+    self.__offsets.extend(match.end() for match in pattern.finditer(self.__data, start))
+
+  # Decode file in chunks into a temporary UTF-8 file and map it, lines are indexed while writing
+  def __decodeFile(self, filePath: str, encoding: str):
+    self.__file = tempfile.TemporaryFile()
+    # Temporary file has no path
+    self.__filePath = ""
+    self.__offsets = array("Q", [0])
+    decoder = codecs.getincrementaldecoder(encoding)()
+    size: int = 0
+    # "\r\n" may be split between chunks
+    pending: str = ""
+    with open(filePath, "rb") as file:
+      for chunk in itertools.chain(iter(lambda: file.read(self.decodeChunkSize), b""), [None]):
+        text: str = pending + (decoder.decode(chunk) if chunk is not None else decoder.decode(b"", True))
+        pending = "\r" if chunk is not None and text.endswith("\r") else ""
+        data: bytes = text[:len(text) - len(pending)].encode("utf-8")
+        self.__offsets.extend(size + match.end() for match in self.lineBreakPattern.finditer(data))
+        self.__file.write(data)
+        size += len(data)
+    self.__file.flush()
+    self.__data = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b""
+
+  def __len__(self) -> int:
+    return len(self.__lineNumbers)
+
+  def __getitem__(self, key: Union[int, slice]) -> Union[str, "TextLines"]:
+    # Slice shares the file data
+    if isinstance(key, slice):
+      view = object.__new__(TextLines)
+      view.__file = self.__file
+      view.__filePath = self.__filePath
+      view.__data = self.__data
+      view.__offsets = self.__offsets
+      view.__lineNumbers = self.__lineNumbers[key]
+      return view
+    lineNumber: int = self.__lineNumbers[key]
+    line: str = self.__data[self.__offsets[lineNumber]:self.__offsets[lineNumber + 1]].decode("utf-8")
+    for lineBreak in self.lineBreaks:
+      if line.endswith(lineBreak):
+        return line[:-len(lineBreak)]
+    return line
+
+  def __iter__(self) -> Iterator[str]:
+    if self.__lineNumbers.step != 1:
+      for index in range(len(self.__lineNumbers)):
+        yield self[index]
+      return
+    # Decode lines in chunks
+    for start in range(self.__lineNumbers.start, self.__lineNumbers.stop, self.chunkSize):
+      end: int = min(start + self.chunkSize, self.__lineNumbers.stop)
+      yield from self.__data[self.__offsets[start]:self.__offsets[end]].decode("utf-8").splitlines()
+
+  # Encoded text of lines in [startIndex, endIndex) with line breaks
+  def rawBytes(self, startIndex: int = 0, endIndex: int = None) -> bytes:
+    lineNumbers: range = self.__lineNumbers[startIndex:endIndex]
+    if len(lineNumbers) == 0:
+      return b""
+    return self.__data[self.__offsets[lineNumbers.start]:self.__offsets[lineNumbers.stop]]
+
+  # Lines in [startIndex, endIndex) for another process as (UTF-8 file path, start offset, end offset, encoded text)
+  # Encoded text is only copied when the text is decoded into a temporary file
+  def source(self, startIndex: int = 0, endIndex: int = None) -> Tuple[str, int, int, bytes]:
+    lineNumbers: range = self.__lineNumbers[startIndex:endIndex]
+    if len(lineNumbers) == 0:
+      return ("", 0, 0, b"")
+    startOffset, endOffset = self.__offsets[lineNumbers.start], self.__offsets[lineNumbers.stop]
+    if self.__filePath == "":
+      return ("", startOffset, endOffset, self.__data[startOffset:endOffset])
+    return (self.__filePath, startOffset, endOffset, b"")
+
+  # Split lines in [startIndex, endIndex) into ranges of at most maxBytes encoded bytes and maxLines lines, 0 is no limit
+  # Return start index of every range, a line longer than maxBytes is a range of its own
+  def split(self, startIndex: int, endIndex: int, maxBytes: int = 0, maxLines: int = 0) -> List[int]:
+    startIndexes: List[int] = [startIndex]
+    start: int = self.__lineNumbers.start
+    index: int = startIndex
+    while True:
+      end: int = endIndex
+      if maxLines > 0:
+        end = min(end, index + maxLines)
+      if maxBytes > 0:
+        # Last line ending within budget
+        byteEnd: int = bisect.bisect_right(self.__offsets, self.__offsets[start + index] + maxBytes, start + index + 1, start + endIndex + 1) - 1 - start
+        end = min(end, max(byteEnd, index + 1))
+      if end >= endIndex:
+        return startIndexes
+      startIndexes.append(end)
+      index = end
+
+  # Find first line containing substring by searching encoded text directly, -1 if not found
+  def find(self, substring: str, startIndex: int = 0, endIndex: int = None) -> int:
+    lineNumbers: range = self.__lineNumbers[startIndex:endIndex]
+    if len(lineNumbers) == 0:
+      return -1
+    position: int = self.__data.find(substring.encode("utf-8"), self.__offsets[lineNumbers.start], self.__offsets[lineNumbers.stop])
+    if position < 0:
+      return -1
+    return bisect.bisect_right(self.__offsets, position, lineNumbers.start, lineNumbers.stop) - 1 - self.__lineNumbers.start
+
+  def close(self):
+    if isinstance(self.__data, mmap.mmap):
+      self.__data.close()
+    if self.__file:
+      self.__file.close()
+
+
+# Common Chinese characters and punctuations in simplified and traditional script
+commonCharacters: Set[str] = set("的一是了我不人在他有這个個上们們来來到时時大地为為子中你说說生国國年着著就那和要她出也得里裡后後自以会會家可下而过過天去能对對小多然于於心学學么麼之都好看起发發当當没沒成只如事把还還用第样樣道想作种種开開美总總从從无無情己面最女但现現前些所同日手又行意动動方期它头頭经經长長儿兒回位分爱愛老因很给給名法间間知世什两兩次使身者被高已亲親其进進此话話常与與活正感，。、！？「」：…　")
+# Legacy encodings tried when text is not UTF-8, GB18030 is a superset of GBK and CP950 of Big5
+legacyEncodings: Tuple[str, ...] = ("gb18030", "cp950", "utf-16-le", "utf-16-be")
+
+
+# Guess text encoding from the first sampleSize bytes, BOM first, then UTF-8, then the legacy encoding decoding most common characters
+def detectEncoding(filePath: str, sampleSize: int = 1 << 16) -> str:
+  with open(filePath, "rb") as file:
+    sample: bytes = file.read(sampleSize)
+  # UTF-32 BOM starts with UTF-16 BOM
+  for bom, encoding in ((codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")):
+    if sample.startswith(bom):
+      return encoding
+  # Last character may be cut by sample end
+  try:
+    codecs.getincrementaldecoder("utf-8")().decode(sample, len(sample) < sampleSize)
+    return "utf-8"
+  except UnicodeDecodeError:
+    pass
+
+  scores: Dict[str, int] = {}
+  for encoding in legacyEncodings:
+    text: str = codecs.getincrementaldecoder(encoding)(errors="replace").decode(sample)
+    scores[encoding] = sum(1 for character in text if character in commonCharacters) - 10 * text.count("\ufffd")
+  return max(legacyEncodings, key=lambda encoding: scores[encoding])
+
+
+# Read whole file as bytes
+def readFile(filePath: str) -> bytes:
+  with open(filePath, "rb") as file:
+    return file.read()
@@ -0,0 +1,262 @@
+from book import RawBook, listIllustrationsPath
+from book.cache import ConversionCache, hashFile
+from book.instrumentation import Instrumentation, chromeTraceEvents
+from book.normalize import normalizeStages
+from image import ImageOptions, transcodeImages, trimImageCache
+
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+import argparse
+import cProfile
+import glob
+import json
+import os
+import time
+
+
+# Expand files, directories and globs to text file paths
+# Directories are searched for .txt files, other files are only converted when given by name
+def expandPaths(patterns: List[str]) -> List[str]:
+  textPaths: List[str] = []
+  for pattern in patterns:
+    if os.path.isfile(pattern):
+      textPaths.append(pattern)
+      continue
+    for path in [pattern] if os.path.isdir(pattern) else sorted(glob.glob(pattern, recursive=True)):
+      if os.path.isdir(path):
+        for dirPath, _, fileNames in os.walk(path):
+          textPaths += [os.path.join(dirPath, fileName) for fileName in sorted(fileNames) if fileName.endswith(".txt")]
+      elif path.endswith(".txt"):
+        textPaths.append(path)
+  # Remove duplicated paths but keep order
+  return list(dict.fromkeys(os.path.abspath(textPath) for textPath in textPaths))
+
+
+# Output directory of text file, its directory relative to rootDirPath is kept under outputDirPath
+# Every book has its own directory for its images, so many books have the same text file name
+def bookOutputDirPath(textPath: str, rootDirPath: str, outputDirPath: str) -> str:
+  if outputDirPath == "":
+    return ""
+  return os.path.normpath(os.path.join(outputDirPath, os.path.relpath(os.path.dirname(os.path.abspath(textPath)), rootDirPath)))
+
+
+# EPUB path of text file, next to text file when outputDirPath is empty
+def epubPath(textPath: str, outputDirPath: str = "") -> str:
+  filePath: str = os.path.splitext(textPath)[0] + ".epub"
+  if outputDirPath != "":
+    filePath = os.path.join(outputDirPath, os.path.basename(filePath))
+  return filePath
+
+
+# Book fields set like UI form fields, "contents" is contents with chapter level as prefixed \t
+overrideFields: List[str] = ["title", "author", "illustrator", "translator", "source", "language", "subject", "illustrationPrefix", "illustrationSuffix", "contents"]
+
+
+# Convert one text file to EPUB, return summary
+# Without cacheBook only chapters are cached, for EPUB paths never converted again
+def convertBook(textPath: str, outputDirPath: str = "", imageOptions: ImageOptions = ImageOptions(), imageJobs: int = 1, conversionCache: ConversionCache = None, profileDirPath: str = "", encoding: str = "", splitBytes: int = RawBook.maxSplitBytes, splitLines: int = RawBook.maxSplitLines, renderJobs: int = 1, normalization: List[str] = [], compressLevel: int = RawBook.compressLevel, storeImages: bool = RawBook.storeImages, overrides: Dict[str, str] = {}, cacheBook: bool = True) -> Dict:
+  startTime = time.perf_counter()
+  instrumentation = Instrumentation(textPath)
+  profile = cProfile.Profile() if profileDirPath != "" else None
+  if profile is not None:
+    profile.enable()
+  epubFilePath: str = epubPath(textPath, outputDirPath)
+  summary: Dict = {"text": textPath, "epub": epubFilePath, "type": "", "encoding": "", "chapters": 0, "unmatched": [], "time": 0.0, "writeTime": 0.0, "size": 0, "cached": False, "error": "", "pid": os.getpid()}
+
+  try:
+    # Skip book if text, images, output and options are same as last conversion
+    if conversionCache is not None and cacheBook:
+      bookKey: str = conversionCache.key(hashFile(textPath), epubFilePath, encoding, "%d:%d" % (splitBytes, splitLines), ",".join(normalization), "%d:%d" % (compressLevel, storeImages), repr(sorted(overrides.items())), imageOptions.key(), *imagesKey(os.path.dirname(textPath)))
+      cachedSummary = conversionCache.getBook(bookKey)
+      instrumentation.stageFinished("cacheLookup", time.perf_counter() - startTime)
+      if cachedSummary is not None:
+        summary.update(cachedSummary)
+        summary["cached"] = True
+        summary["pid"] = os.getpid()
+
+    if not summary["cached"]:
+      if outputDirPath != "":
+        os.makedirs(outputDirPath, exist_ok=True)
+      with RawBook(textPath, instrumentation, encoding) as book:
+        summary["type"] = book.rawTextType.name
+        summary["encoding"] = book.encoding
+        book.maxSplitBytes = splitBytes
+        book.maxSplitLines = splitLines
+        book.renderJobs = renderJobs
+        book.normalization = normalization
+        book.compressLevel = compressLevel
+        book.storeImages = storeImages
+        # Chapters are rendered in processes and compressed in threads of the same jobs
+        book.compressJobs = renderJobs
+        # Same steps as opening a file, editing form and pressing OK in UI
+        book.initContents()
+        for field, value in overrides.items():
+          if field == "contents":
+            book.setContents(value)
+          elif field in overrideFields:
+            setattr(book, field, value)
+        book.initChaptersIndex()
+        book.findIllustrationsIndex(book.illustrationPrefix, book.illustrationSuffix)
+        if imageOptions.enabled():
+          with book.stage("transcodeImages"):
+            book.illustrationFiles = transcodeImages([illustration for illustration, index in book.illustrations.items() if index >= 0], imageOptions, imageJobs)
+        book.initEpub()
+        book.writeEpub(epubFilePath, conversionCache)
+
+        summary["chapters"] = len(book.contents)
+        summary["unmatched"] = [chapter.string for chapter in book.contents if chapter.index < 0]
+      summary["size"] = os.path.getsize(epubFilePath)
+      summary["writeTime"] = instrumentation.stageTimes().get("writeEpub", 0.0)
+      if conversionCache is not None and cacheBook:
+        conversionCache.putBook(bookKey, epubFilePath, summary)
+  except Exception as exception:
+    summary["error"] = "%s: %s" % (type(exception).__name__, exception)
+  summary["time"] = time.perf_counter() - startTime
+  summary["instrumentation"] = instrumentation.toDict()
+  if profile is not None:
+    profile.disable()
+    os.makedirs(profileDirPath, exist_ok=True)
+    profile.dump_stats(os.path.join(profileDirPath, os.path.splitext(os.path.basename(textPath))[0] + ".%d.prof" % os.getpid()))
+  return summary
+
+
+# Images are identified by name, size and modification time, hashing all images costs more than converting
+def imagesKey(dirPath: str) -> List[str]:
+  keys: List[str] = []
+  for illustration in sorted(listIllustrationsPath(dirPath)):
+    status = os.stat(illustration)
+    keys.append("%s:%d:%d" % (illustration, status.st_size, status.st_mtime_ns))
+  return keys
+
+
+# Print one line for a book summary
+def printSummary(summary: Dict):
+  if summary["error"] != "":
+    print("FAIL %s (%.2fs): %s" % (summary["text"], summary["time"], summary["error"]), flush=True)
+    return
+  print("%s %s -> %s [%s, %s] chapters: %d, unmatched: %d, time: %.2fs, write: %.2fs, size: %d" % ("SKIP" if summary["cached"] else "OK  ", summary["text"], summary["epub"], summary["type"], summary["encoding"], summary["chapters"], len(summary["unmatched"]), summary["time"], summary.get("writeTime", 0.0), summary["size"]), flush=True)
+  for chapter in summary["unmatched"]:
+    print("       unmatched: %s" % chapter, flush=True)
+
+
+# Remove least recently used books, chapters and transcoded images over cache sizes
+def trimCaches(conversionCache: ConversionCache = None, imageOptions: ImageOptions = None):
+  if conversionCache is not None:
+    conversionCache.trim()
+  # Image cache only grows when images are transcoded
+  if imageOptions is not None and imageOptions.enabled():
+    trimImageCache(imageOptions)
+
+
+# Comma separated normalization stage names
+def stageNames(value: str) -> List[str]:
+  names: List[str] = [name for name in value.split(",") if name != ""]
+  for name in names:
+    if name not in normalizeStages:
+      raise argparse.ArgumentTypeError("unknown stage %s, stages are %s" % (name, ", ".join(normalizeStages)))
+  return names
+
+
+# Options of every book conversion, shared by commands converting books
+def addConversionArguments(parser: argparse.ArgumentParser):
+  parser.add_argument("--encoding", default="", help="text file encoding, detected by default")
+  parser.add_argument("--split-size", type=int, default=RawBook.maxSplitBytes // 1024, help="split chapters into XHTML files of this many KiB of text, 0 is no limit")
+  parser.add_argument("--split-lines", type=int, default=RawBook.maxSplitLines, help="split chapters into XHTML files of this many lines, 0 is no limit")
+  parser.add_argument("--normalize", type=stageNames, default=[], help="comma separated text normalization stages run in order: %s" % ", ".join(normalizeStages))
+  parser.add_argument("--compress-level", type=int, choices=range(0, 10), default=RawBook.compressLevel, metavar="0-9", help="deflate level of XHTML and other text in EPUB")
+  parser.add_argument("--compress-images", action="store_true", help="also deflate images, they are stored uncompressed by default")
+  parser.add_argument("--image-max-width", type=int, default=0, help="shrink images to this width")
+  parser.add_argument("--image-max-height", type=int, default=0, help="shrink images to this height")
+  parser.add_argument("--image-format", choices=["", "jpeg", "webp"], default="", help="recompress images to this format")
+  parser.add_argument("--image-quality", type=int, default=85, help="JPEG/WebP quality")
+  parser.add_argument("--image-cache", default="", help="transcoded image cache directory")
+  parser.add_argument("--image-cache-size", type=int, default=ImageOptions.cacheMaxBytes >> 20, help="MiB of least recently used transcoded images kept in cache, 0 is no limit")
+  parser.add_argument("--cache", default="", help="conversion cache directory, default is %s" % ConversionCache.cacheDirPath)
+  parser.add_argument("--cache-size", type=int, default=ConversionCache.maxBytes >> 20, help="MiB of least recently used books and chapters kept in cache, 0 is no limit")
+  parser.add_argument("--no-cache", action="store_true", help="always convert and render all chapters")
+
+
+def main(argv: List[str] = None) -> int:
+  parser = argparse.ArgumentParser(prog="simplepub convert", description="Convert text files to EPUB without UI")
+  parser.add_argument("paths", nargs="+", help="text files, directories or globs")
+  parser.add_argument("-o", "--output", default="", help="output directory, default is next to text file")
+  parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+  addConversionArguments(parser)
+  parser.add_argument("--stats", default="", help="write summaries with stage timings and counters to this JSON file")
+  parser.add_argument("--trace", default="", help="write stage timings of all books to this Chrome trace file")
+  parser.add_argument("--profile", default="", help="write cProfile stats of every book to this directory, book directories are kept as in output directory")
+  args = parser.parse_args(argv)
+
+  textPaths = expandPaths(args.paths)
+  if textPaths == []:
+    print("No text file found")
+    return 1
+  # Books in different directories may have same name, they would overwrite each other
+  rootDirPath: str = os.path.commonpath([os.path.dirname(textPath) for textPath in textPaths])
+  outputDirPaths: List[str] = [bookOutputDirPath(textPath, rootDirPath, args.output) for textPath in textPaths]
+  epubPaths: Dict[str, str] = {}
+  for textPath, bookOutputDir in zip(textPaths, outputDirPaths):
+    otherTextPath: str = epubPaths.setdefault(os.path.normcase(epubPath(textPath, bookOutputDir)), textPath)
+    if otherTextPath != textPath:
+      print("%s and %s are both converted to %s" % (otherTextPath, textPath, epubPath(textPath, bookOutputDir)))
+      return 1
+  # Profiles are kept in book directories like EPUB files, every book may be named book.txt
+  profileDirPaths: List[str] = [bookOutputDirPath(textPath, rootDirPath, args.profile) for textPath in textPaths]
+
+  imageOptions = ImageOptions(args.image_max_width, args.image_max_height, args.image_format, args.image_quality, args.image_cache, args.image_cache_size << 20)
+  # Books are already converted in parallel, only a single book uses all workers for images and chapters
+  bookJobs: int = args.jobs if len(textPaths) == 1 else 1
+  conversionCache = ConversionCache(args.cache, args.cache_size << 20) if not args.no_cache else None
+
+  # Imported only to convert, headless commands importing cli stay fast to start
+  from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+  from concurrent.futures.process import BrokenProcessPool
+
+  startTime = time.perf_counter()
+  summaries: List[Dict] = []
+  jobs: int = max(1, args.jobs)
+  # Books waiting for a worker, at most jobs books are submitted so a dead worker only fails books being converted
+  books: Deque[Tuple[str, str, str]] = deque(zip(textPaths, outputDirPaths, profileDirPaths))
+  # future: text path
+  running: Dict[Future, str] = {}
+  executor = ProcessPoolExecutor(max_workers=jobs)
+  try:
+    while books or running:
+      while books and len(running) < jobs:
+        textPath, bookOutputDir, profileDir = books[0]
+        try:
+          future: Future = executor.submit(convertBook, textPath, bookOutputDir, imageOptions, bookJobs, conversionCache, profileDir, args.encoding, args.split_size * 1024, args.split_lines, bookJobs, args.normalize, args.compress_level, not args.compress_images)
+        except BrokenProcessPool:
+          # A worker died, such as killed for memory on a huge book, its books failed and remaining books get a new pool
+          executor.shutdown(wait=False)
+          executor = ProcessPoolExecutor(max_workers=jobs)
+          continue
+        books.popleft()
+        running[future] = textPath
+      finishedFutures, _ = wait(running, return_when=FIRST_COMPLETED)
+      for future in finishedFutures:
+        textPath = running.pop(future)
+        try:
+          summary: Dict = future.result()
+        except Exception as exception:
+          summary = {"text": textPath, "time": 0.0, "error": "%s: %s" % (type(exception).__name__, exception)}
+        summaries.append(summary)
+        printSummary(summary)
+  finally:
+    executor.shutdown(wait=True)
+  trimCaches(conversionCache, imageOptions)
+
+  if args.stats != "":
+    with open(args.stats, "wt", encoding="utf-8") as file:
+      json.dump(summaries, file, ensure_ascii=False, indent=2)
+  if args.trace != "":
+    traceEvents: List[Dict] = []
+    # Books failed by a dead worker have no stage timings
+    for summary in [summary for summary in summaries if "instrumentation" in summary]:
+      traceEvents += chromeTraceEvents(summary["instrumentation"], summary["pid"])
+    with open(args.trace, "wt", encoding="utf-8") as file:
+      json.dump({"traceEvents": traceEvents}, file, ensure_ascii=False)
+
+  failed = len([summary for summary in summaries if summary["error"] != ""])
+  print("%d books, %d failed, %.2fs" % (len(summaries), failed, time.perf_counter() - startTime))
+  return 0 if failed == 0 else 1
@@ -0,0 +1,106 @@
+from book.cache import hashFile, touchFile, trimFiles, writeFileAtomic
+
+from typing import Dict, List, Tuple
+import hashlib
+import io
+import os
+
+
+# Image resize and recompress settings
+class ImageOptions:
+  # 0 means no limit
+  maxWidth: int = 0
+  maxHeight: int = 0
+  # "", "jpeg" or "webp", empty keeps original format
+  format: str = ""
+  quality: int = 85
+  cacheDirPath: str = os.path.join(os.path.expanduser("~"), ".cache", "simplepub", "images")
+  # Least recently used images over this size are removed by trimImageCache, 0 is no limit
+  cacheMaxBytes: int = 256 << 20
+
+  def __init__(self, maxWidth: int = 0, maxHeight: int = 0, format: str = "", quality: int = 85, cacheDirPath: str = "", cacheMaxBytes: int = -1):
+    self.maxWidth = maxWidth
+    self.maxHeight = maxHeight
+    self.format = format
+    self.quality = quality
+    if cacheDirPath != "":
+      self.cacheDirPath = cacheDirPath
+    if cacheMaxBytes >= 0:
+      self.cacheMaxBytes = cacheMaxBytes
+
+  # Images are only transcoded when options change them
+  def enabled(self) -> bool:
+    return self.maxWidth > 0 or self.maxHeight > 0 or self.format != ""
+
+  # Settings part of cache key
+  def key(self) -> str:
+    return "%d:%d:%s:%d" % (self.maxWidth, self.maxHeight, self.format, self.quality)
+
+
+# Cached output path for a source image hash, extension is decided by format
+def cachePath(sourceHash: str, sourcePath: str, options: ImageOptions) -> str:
+  extension: str = {"jpeg": ".jpg", "webp": ".webp"}.get(options.format, os.path.splitext(sourcePath)[1].lower())
+  key: str = hashlib.sha256((sourceHash + options.key()).encode("utf-8")).hexdigest()
+  return os.path.join(options.cacheDirPath, key[0:2], key + extension)
+
+
+# Resize and recompress one image into outputPath
+def transcodeImage(sourcePath: str, outputPath: str, options: ImageOptions) -> str:
+  # Pillow is only imported when images are transcoded
+  from PIL import Image
+
+  with Image.open(sourcePath) as image:
+    image.load()
+    imageFormat: str = options.format.upper() if options.format != "" else image.format
+    # Only shrink
+    if options.maxWidth > 0 or options.maxHeight > 0:
+      image.thumbnail((options.maxWidth or image.width, options.maxHeight or image.height), Image.LANCZOS)
+    # JPEG has no alpha channel, use white background
+    if imageFormat == "JPEG" and image.mode != "RGB":
+      image = image.convert("RGBA")
+      background = Image.new("RGB", image.size, (255, 255, 255))
+      background.paste(image, mask=image.split()[3])
+      image = background
+
+    # Other processes may write the same cache file
+    file = io.BytesIO()
+    if imageFormat == "PNG":
+      image.save(file, imageFormat, optimize=True)
+    else:
+      image.save(file, imageFormat, quality=options.quality)
+    writeFileAtomic(outputPath, file.getvalue())
+  return outputPath
+
+
+# Transcode images with cache, return sourcePath: outputPath
+def transcodeImages(sourcePaths: List[str], options: ImageOptions, jobs: int = 1) -> Dict[str, str]:
+  # Identical images are transcoded once
+  # outputPath: sourcePaths
+  outputs: Dict[str, List[str]] = {}
+  for sourcePath in sourcePaths:
+    outputs.setdefault(cachePath(hashFile(sourcePath), sourcePath, options), []).append(sourcePath)
+
+  tasks: List[Tuple[str, str]] = []
+  for outputPath, paths in outputs.items():
+    if os.path.exists(outputPath):
+      touchFile(outputPath)
+    else:
+      tasks.append((paths[0], outputPath))
+  if jobs > 1 and len(tasks) > 1:
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+      list(executor.map(transcodeImage, [task[0] for task in tasks], [task[1] for task in tasks], [options] * len(tasks)))
+  else:
+    for sourcePath, outputPath in tasks:
+      transcodeImage(sourcePath, outputPath, options)
+
+  return {sourcePath: outputPath for outputPath, paths in outputs.items() for sourcePath in paths}
+
+
+# Files written by transcodeImage
+cacheExtensions: Tuple[str, ...] = (".png", ".jpg", ".webp")
+
+
+# Remove least recently used transcoded images over cache size, return bytes removed
+def trimImageCache(options: ImageOptions) -> int:
+  return trimFiles(options.cacheDirPath, options.cacheMaxBytes, cacheExtensions)
@@ -89,17 +89,51 @@ class Ui_MainWindow(object):
 
         self.verticalLayout_3.addWidget(self.contentsLabel)
 
-        self.contentsTextEdit = QPlainTextEdit(self.centralwidget)
-        self.contentsTextEdit.setObjectName(u"contentsTextEdit")
+        self.contentsTreeView = QTreeView(self.centralwidget)
+        self.contentsTreeView.setObjectName(u"contentsTreeView")
         sizePolicy3 = QSizePolicy(QSizePolicy.Preferred, QSizePolicy.Expanding)
         sizePolicy3.setHorizontalStretch(0)
         sizePolicy3.setVerticalStretch(0)
-        sizePolicy3.setHeightForWidth(self.contentsTextEdit.sizePolicy().hasHeightForWidth())
-        self.contentsTextEdit.setSizePolicy(sizePolicy3)
-        self.contentsTextEdit.setLineWrapMode(QPlainTextEdit.NoWrap)
-        self.contentsTextEdit.setTabStopDistance(20.000000000000000)
+        sizePolicy3.setHeightForWidth(self.contentsTreeView.sizePolicy().hasHeightForWidth())
+        self.contentsTreeView.setSizePolicy(sizePolicy3)
+        self.contentsTreeView.setUniformRowHeights(True)
 
-        self.verticalLayout_3.addWidget(self.contentsTextEdit)
+        self.verticalLayout_3.addWidget(self.contentsTreeView)
+
+        self.contentsButtonsLayout = QHBoxLayout()
+        self.contentsButtonsLayout.setObjectName(u"contentsButtonsLayout")
+        self.addChapterButton = QPushButton(self.centralwidget)
+        self.addChapterButton.setObjectName(u"addChapterButton")
+
+        self.contentsButtonsLayout.addWidget(self.addChapterButton)
+
+        self.removeChapterButton = QPushButton(self.centralwidget)
+        self.removeChapterButton.setObjectName(u"removeChapterButton")
+
+        self.contentsButtonsLayout.addWidget(self.removeChapterButton)
+
+        self.indentChapterButton = QPushButton(self.centralwidget)
+        self.indentChapterButton.setObjectName(u"indentChapterButton")
+
+        self.contentsButtonsLayout.addWidget(self.indentChapterButton)
+
+        self.outdentChapterButton = QPushButton(self.centralwidget)
+        self.outdentChapterButton.setObjectName(u"outdentChapterButton")
+
+        self.contentsButtonsLayout.addWidget(self.outdentChapterButton)
+
+        self.moveChapterUpButton = QPushButton(self.centralwidget)
+        self.moveChapterUpButton.setObjectName(u"moveChapterUpButton")
+
+        self.contentsButtonsLayout.addWidget(self.moveChapterUpButton)
+
+        self.moveChapterDownButton = QPushButton(self.centralwidget)
+        self.moveChapterDownButton.setObjectName(u"moveChapterDownButton")
+
+        self.contentsButtonsLayout.addWidget(self.moveChapterDownButton)
+
+
+        self.verticalLayout_3.addLayout(self.contentsButtonsLayout)
 
 
         self.horizontalLayout_4.addLayout(self.verticalLayout_3)
@@ -280,6 +314,12 @@ class Ui_MainWindow(object):
         MainWindow.setWindowTitle(QCoreApplication.translate("MainWindow", u"simplepub.py", None))
         self.openFileButton.setText(QCoreApplication.translate("MainWindow", u"Open File", None))
         self.contentsLabel.setText(QCoreApplication.translate("MainWindow", u"Contents:", None))
+        self.addChapterButton.setText(QCoreApplication.translate("MainWindow", u"Add", None))
+        self.removeChapterButton.setText(QCoreApplication.translate("MainWindow", u"Remove", None))
+        self.indentChapterButton.setText(QCoreApplication.translate("MainWindow", u"Indent", None))
+        self.outdentChapterButton.setText(QCoreApplication.translate("MainWindow", u"Outdent", None))
+        self.moveChapterUpButton.setText(QCoreApplication.translate("MainWindow", u"Up", None))
+        self.moveChapterDownButton.setText(QCoreApplication.translate("MainWindow", u"Down", None))
         self.IllustrationFlagLabel.setText(QCoreApplication.translate("MainWindow", u"Illustration Flag:", None))
         self.IllustrationPrefixlabel.setText(QCoreApplication.translate("MainWindow", u"Prefix:", None))
         self.IllustrationSuffixlabel.setText(QCoreApplication.translate("MainWindow", u"Suffix:", None))
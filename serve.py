@@ -0,0 +1,380 @@
+from book.cache import ConversionCache
+from cli import addConversionArguments, convertBook, overrideFields, trimCaches
+from image import ImageOptions
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.message import Message
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Deque, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+import argparse
+import asyncio
+import functools
+import io
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import traceback
+import uuid
+import zipfile
+
+# Files taken from uploads, other files are ignored
+imageExtensions: Tuple[str, ...] = (".png", ".jpg", ".webp")
+
+
+# Conversion submitted over HTTP
+class Job:
+  def __init__(self, jobId: str, dirPath: str, textPath: str, overrides: Dict[str, str]):
+    self.id = jobId
+    # Job directory holds input text, images and output EPUB
+    self.dirPath = dirPath
+    self.textPath = textPath
+    self.overrides = overrides
+    # "queued", "running", "done" or "failed"
+    self.status: str = "queued"
+    self.submitTime: float = time.time()
+    self.startTime: float = 0.0
+    self.finishTime: float = 0.0
+    self.summary: Dict = {}
+
+  def toDict(self) -> Dict:
+    summary: Dict = {key: value for key, value in self.summary.items() if key not in ("text", "epub", "pid", "instrumentation")}
+    if "instrumentation" in self.summary:
+      summary["stages"] = self.summary["instrumentation"]["stages"]
+    return {"id": self.id, "status": self.status, "submitTime": self.submitTime, "startTime": self.startTime, "finishTime": self.finishTime, "summary": summary}
+
+
+# Reject request with HTTP status
+class RequestError(Exception):
+  def __init__(self, status: int, message: str, headers: Dict[str, str] = {}):
+    super().__init__(message)
+    self.status = status
+    self.headers = headers
+
+
+# Save uploaded text and images into job directory, return text path
+# Upload is a multipart form with "text", "images" and "zip" files and override fields, a zip file, or a text file
+def saveUpload(dirPath: str, contentType: str, body: bytes, overrides: Dict[str, str]) -> str:
+  # (file name, content)
+  files: List[Tuple[str, bytes]] = []
+  if contentType.startswith("multipart/form-data"):
+    message: Message = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + contentType.encode("latin-1") + b"\r\n\r\n" + body)
+    if not message.is_multipart():
+      raise RequestError(400, "Invalid multipart form")
+    for part in message.iter_parts():
+      name: str = part.get_param("name", header="content-disposition") or ""
+      content: bytes = part.get_payload(decode=True) or b""
+      if name in overrideFields and part.get_filename() is None:
+        overrides[name] = content.decode(part.get_content_charset() or "utf-8")
+      elif name == "zip":
+        files += readZip(content)
+      elif part.get_filename() is not None:
+        files.append((part.get_filename(), content))
+  elif contentType.startswith(("application/zip", "application/x-zip-compressed")):
+    files += readZip(body)
+  elif contentType.startswith("text/plain"):
+    files.append(("book.txt", body))
+  else:
+    raise RequestError(415, "Upload a multipart form, a zip file or a text file")
+
+  textPath: str = ""
+  for fileName, content in files:
+    # Directories in names are dropped, images are found next to text
+    fileName = os.path.basename(fileName.replace("\\", "/"))
+    extension: str = os.path.splitext(fileName)[1].lower()
+    if extension == ".txt" and textPath == "":
+      textPath = os.path.join(dirPath, fileName)
+    elif extension not in imageExtensions:
+      continue
+    with open(os.path.join(dirPath, fileName), "wb") as file:
+      file.write(content)
+  if textPath == "":
+    raise RequestError(400, "No text file uploaded")
+  return textPath
+
+
+# (file name, content) of files in zip
+def readZip(data: bytes) -> List[Tuple[str, bytes]]:
+  try:
+    with zipfile.ZipFile(io.BytesIO(data)) as zipFile:
+      return [(zipFileName(info), zipFile.read(info)) for info in zipFile.infolist() if not info.is_dir()]
+  except zipfile.BadZipFile as exception:
+    raise RequestError(400, "Invalid zip file: %s" % exception)
+
+
+# Name of file in zip, names without UTF-8 flag are often UTF-8 or GB18030 rather than CP437
+# Illustrations are matched by name, so names must be decoded as in text
+def zipFileName(info: zipfile.ZipInfo) -> str:
+  if info.flag_bits & 0x800:
+    return info.filename
+  try:
+    rawName: bytes = info.filename.encode("cp437")
+  except UnicodeEncodeError:
+    return info.filename
+  for encoding in ("utf-8", "gb18030"):
+    try:
+      return rawName.decode(encoding)
+    except UnicodeDecodeError:
+      pass
+  return info.filename
+
+
+# HTTP service converting uploaded books on a process pool, jobs wait in a bounded queue
+class ConversionService:
+  # Requests larger than this are rejected
+  maxBodyBytes: int = 256 << 20
+  # Finished jobs kept for status and download, older ones are deleted
+  keepJobs: int = 100
+  # Finished jobs kept for latency metrics
+  historySize: int = 1000
+  # Trimmed after jobs finish, at most once every trimSeconds
+  conversionCache: ConversionCache = None
+  imageOptions: ImageOptions = None
+  trimSeconds: float = 60.0
+
+  def __init__(self, workDirPath: str, jobs: int, queueSize: int, convertArgs: Tuple = ()):
+    self.workDirPath = workDirPath
+    self.jobs = max(1, jobs)
+    # Arguments of convertBook after text path and output directory, overrides are added per job
+    # Only chapters are cached, every job writes its EPUB into its own directory so books are never converted again
+    self.convertArgs = convertArgs
+    self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+    self.queue: asyncio.Queue = asyncio.Queue(max(1, queueSize))
+    # jobId: job, in submit order
+    self.allJobs: Dict[str, Job] = {}
+    self.runningCount: int = 0
+    # (finish time, seconds queued, seconds from submit to finish) of finished jobs
+    self.history: Deque[Tuple[float, float, float]] = deque(maxlen=self.historySize)
+    self.counts: Dict[str, int] = {"submitted": 0, "rejected": 0, "converted": 0, "failed": 0}
+    self.startTime: float = time.time()
+    self.trimTime: float = 0.0
+
+  # Convert queued jobs, jobs workers run at once
+  async def worker(self):
+    loop = asyncio.get_running_loop()
+    while True:
+      job: Job = await self.queue.get()
+      job.status = "running"
+      job.startTime = time.time()
+      self.runningCount += 1
+      executor: ProcessPoolExecutor = self.executor
+      try:
+        job.summary = await loop.run_in_executor(executor, functools.partial(convertBook, job.textPath, job.dirPath, *self.convertArgs, overrides=job.overrides, cacheBook=False))
+      except BrokenProcessPool as exception:
+        # A worker died, such as killed for memory on a huge book, running jobs fail and later jobs get a new pool
+        if self.executor is executor:
+          executor.shutdown(wait=False)
+          self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+        job.summary = {"error": "%s: %s" % (type(exception).__name__, exception)}
+      except Exception as exception:
+        job.summary = {"error": "%s: %s" % (type(exception).__name__, exception)}
+      self.runningCount -= 1
+      job.finishTime = time.time()
+      job.status = "failed" if job.summary["error"] != "" else "done"
+      self.counts["failed" if job.status == "failed" else "converted"] += 1
+      self.history.append((job.finishTime, job.startTime - job.submitTime, job.finishTime - job.submitTime))
+      self.removeOldJobs()
+      if job.finishTime - self.trimTime >= self.trimSeconds:
+        self.trimTime = job.finishTime
+        await asyncio.to_thread(trimCaches, self.conversionCache, self.imageOptions)
+      self.queue.task_done()
+
+  # Delete oldest finished jobs over keepJobs
+  def removeOldJobs(self):
+    finishedJobs: List[Job] = [job for job in self.allJobs.values() if job.status in ("done", "failed")]
+    for job in finishedJobs[:max(0, len(finishedJobs) - self.keepJobs)]:
+      self.removeJob(job)
+
+  def removeJob(self, job: Job):
+    del self.allJobs[job.id]
+    shutil.rmtree(job.dirPath, ignore_errors=True)
+
+  async def submit(self, contentType: str, body: bytes, query: Dict[str, str]) -> Job:
+    # Reject before saving upload when queue is full
+    if self.queue.full():
+      self.counts["rejected"] += 1
+      raise RequestError(503, "Queue is full", {"Retry-After": "%d" % max(1, self.averageSeconds())})
+    jobId: str = uuid.uuid4().hex
+    dirPath: str = os.path.join(self.workDirPath, jobId)
+    os.makedirs(dirPath)
+    overrides: Dict[str, str] = {field: value for field, value in query.items() if field in overrideFields}
+    try:
+      # Parsing form and writing files blocks, keep serving other requests
+      textPath: str = await asyncio.to_thread(saveUpload, dirPath, contentType, body, overrides)
+    except Exception:
+      shutil.rmtree(dirPath, ignore_errors=True)
+      raise
+    job = Job(jobId, dirPath, textPath, overrides)
+    # Queue may be filled while saving upload
+    try:
+      self.queue.put_nowait(job)
+    except asyncio.QueueFull:
+      shutil.rmtree(dirPath, ignore_errors=True)
+      self.counts["rejected"] += 1
+      raise RequestError(503, "Queue is full", {"Retry-After": "%d" % max(1, self.averageSeconds())})
+    self.allJobs[jobId] = job
+    self.counts["submitted"] += 1
+    return job
+
+  # Average seconds from submit to finish
+  def averageSeconds(self) -> float:
+    return sum(seconds for _, _, seconds in self.history) / len(self.history) if self.history else 0.0
+
+  # Queue depth, throughput and latency
+  def metrics(self) -> Dict:
+    now: float = time.time()
+    waits: List[float] = sorted(wait for _, wait, _ in self.history)
+    latencies: List[float] = sorted(latency for _, _, latency in self.history)
+    return {
+      "uptime": now - self.startTime,
+      "queued": self.queue.qsize(),
+      "queueSize": self.queue.maxsize,
+      "running": self.runningCount,
+      "workers": self.jobs,
+      "submitted": self.counts["submitted"],
+      "rejected": self.counts["rejected"],
+      "converted": self.counts["converted"],
+      "failed": self.counts["failed"],
+      "booksPerMinute": len([finishTime for finishTime, _, _ in self.history if now - finishTime <= 60]),
+      "waitAverage": sum(waits) / len(waits) if waits else 0.0,
+      "waitP95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+      "latencyAverage": sum(latencies) / len(latencies) if latencies else 0.0,
+      "latencyP95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+    }
+
+  # Route request, return (status, headers, body)
+  async def route(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+    url = urlsplit(target)
+    parts: List[str] = [part for part in url.path.split("/") if part != ""]
+    if parts == ["jobs"]:
+      if method == "POST":
+        job: Job = await self.submit(headers.get("content-type", ""), body, dict(parse_qsl(url.query)))
+        return jsonResponse(202, job.toDict(), {"Location": "/jobs/" + job.id})
+      if method == "GET":
+        return jsonResponse(200, [job.toDict() for job in self.allJobs.values()])
+      raise methodError(("GET", "POST"))
+    if parts == ["metrics"]:
+      if method == "GET":
+        return jsonResponse(200, self.metrics())
+      raise methodError(("GET",))
+    if len(parts) == 2 and parts[0] == "jobs":
+      job = self.findJob(parts[1])
+      if method == "GET":
+        return jsonResponse(200, job.toDict())
+      if method == "DELETE":
+        if job.status in ("queued", "running"):
+          raise RequestError(409, "Job is %s" % job.status)
+        self.removeJob(job)
+        return jsonResponse(200, job.toDict())
+      raise methodError(("GET", "DELETE"))
+    if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "epub":
+      job = self.findJob(parts[1])
+      if method != "GET":
+        raise methodError(("GET",))
+      if job.status != "done":
+        raise RequestError(409, "Job is %s" % job.status)
+      with open(job.summary["epub"], "rb") as file:
+        content: bytes = file.read()
+      return 200, {"Content-Type": "application/epub+zip", "Content-Disposition": 'attachment; filename="%s"' % os.path.basename(job.summary["epub"])}, content
+    raise RequestError(404, "Not found")
+
+  def findJob(self, jobId: str) -> Job:
+    job: Job = self.allJobs.get(jobId)
+    if job is None:
+      raise RequestError(404, "No job %s" % jobId)
+    return job
+
+  # Serve one request per connection
+  async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+      try:
+        requestLine: str = (await reader.readline()).decode("latin-1").strip()
+        if requestLine == "":
+          return
+        method, target, _ = requestLine.split(" ", 2)
+        headers: Dict[str, str] = {}
+        while True:
+          line: str = (await reader.readline()).decode("latin-1").strip()
+          if line == "":
+            break
+          name, _, value = line.partition(":")
+          headers[name.strip().lower()] = value.strip()
+        size: int = int(headers.get("content-length", "0"))
+        if size > self.maxBodyBytes:
+          raise RequestError(413, "Request is larger than %d bytes" % self.maxBodyBytes)
+        body: bytes = await reader.readexactly(size) if size > 0 else b""
+        status, responseHeaders, content = await self.route(method, target, headers, body)
+      except RequestError as exception:
+        status, responseHeaders, content = jsonResponse(exception.status, {"error": str(exception)}, exception.headers)
+      except (ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as exception:
+        status, responseHeaders, content = jsonResponse(400, {"error": "Bad request: %s" % exception})
+      except Exception as exception:
+        # Any request gets a response, server keeps running
+        traceback.print_exc()
+        status, responseHeaders, content = jsonResponse(500, {"error": "%s: %s" % (type(exception).__name__, exception)})
+      responseHeaders = {**responseHeaders, "Content-Length": str(len(content)), "Connection": "close"}
+      writer.write(("HTTP/1.1 %d %s\r\n" % (status, statusReasons.get(status, ""))).encode("latin-1"))
+      writer.write("".join("%s: %s\r\n" % header for header in responseHeaders.items()).encode("latin-1") + b"\r\n")
+      writer.write(content)
+      await writer.drain()
+    except ConnectionError:
+      pass
+    finally:
+      writer.close()
+
+  async def run(self, host: str, port: int):
+    server = await asyncio.start_server(self.handle, host, port)
+    workers: List[asyncio.Task] = [asyncio.create_task(self.worker()) for _ in range(self.jobs)]
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signalNumber in (signal.SIGINT, signal.SIGTERM):
+      loop.add_signal_handler(signalNumber, stopped.set)
+    print("Serving on http://%s:%d" % (host, server.sockets[0].getsockname()[1]), file=sys.stderr, flush=True)
+    async with server:
+      await stopped.wait()
+    for worker in workers:
+      worker.cancel()
+    self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+statusReasons: Dict[int, str] = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 415: "Unsupported Media Type", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+# Reject method not allowed on path
+def methodError(methods: Tuple[str, ...]) -> RequestError:
+  return RequestError(405, "Method not allowed, use %s" % " or ".join(methods), {"Allow": ", ".join(methods)})
+
+
+def jsonResponse(status: int, content: object, headers: Dict[str, str] = {}) -> Tuple[int, Dict[str, str], bytes]:
+  return status, {**headers, "Content-Type": "application/json; charset=utf-8"}, json.dumps(content, ensure_ascii=False).encode("utf-8")
+
+
+def main(argv: List[str] = None) -> int:
+  parser = argparse.ArgumentParser(prog="simplepub serve", description="Convert books uploaded over HTTP")
+  parser.add_argument("--host", default="127.0.0.1", help="address to listen on, only this computer by default")
+  parser.add_argument("--port", type=int, default=8080, help="port to listen on, 0 picks a free port")
+  parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+  parser.add_argument("--queue-size", type=int, default=16, help="jobs waiting for a worker, more submissions are rejected")
+  parser.add_argument("--work", default=os.path.join(tempfile.gettempdir(), "simplepub-serve"), help="directory of uploaded books and EPUB files")
+  addConversionArguments(parser)
+  args = parser.parse_args(argv)
+
+  os.makedirs(args.work, exist_ok=True)
+  imageOptions = ImageOptions(args.image_max_width, args.image_max_height, args.image_format, args.image_quality, args.image_cache, args.image_cache_size << 20)
+  conversionCache = ConversionCache(args.cache, args.cache_size << 20) if not args.no_cache else None
+
+  async def serve():
+    service = ConversionService(os.path.abspath(args.work), args.jobs, args.queue_size, (imageOptions, 1, conversionCache, "", args.encoding, args.split_size * 1024, args.split_lines, 1, args.normalize, args.compress_level, not args.compress_images))
+    service.conversionCache = conversionCache
+    service.imageOptions = imageOptions
+    await service.run(args.host, args.port)
+
+  asyncio.run(serve())
+  return 0
@@ -1,8 +1,24 @@
 #!/usr/bin/env python3
 
-from ui import *
+import sys
 
 if __name__ == "__main__":
+  # Convert without UI
+  if len(sys.argv) > 1 and sys.argv[1] == "convert":
+    from cli import main
+    sys.exit(main(sys.argv[2:]))
+  # Convert books dropped into inbox directories until stopped
+  if len(sys.argv) > 1 and sys.argv[1] == "watch":
+    from watch import main
+    sys.exit(main(sys.argv[2:]))
+  # Convert books uploaded over HTTP until stopped
+  if len(sys.argv) > 1 and sys.argv[1] == "serve":
+    from serve import main
+    sys.exit(main(sys.argv[2:]))
+
+  # Qt is only imported by UI
+  from PySide6.QtWidgets import QApplication
+  from ui import UI
   app = QApplication([])
   ui = UI()
   ui.show()
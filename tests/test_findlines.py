@@ -0,0 +1,88 @@
+from book import RawBook
+from book.rawbook import maxTriePrefix
+
+from typing import List
+import random
+
+import pytest
+
+# Long titles share more than maxTriePrefix characters, only the end tells them apart
+longTitle: str = "第一卷 " + "很长的章节标题" * 100
+lines: List[str] = [
+  "书名",
+  "",
+  "第一章 开始",
+  "第一章 开始之后",
+  "第十章",
+  longTitle + "甲",
+  "[img]cover[/img]",
+  "插图 cover",
+  "a.b*c+d?(e)[f]",
+  "abc",
+  "ab",
+  "a",
+  "[img]page01[/img]",
+  "第一章",
+  longTitle,
+]
+substrings: List[str] = [
+  "第一章",
+  "第一章 开始",
+  "第一章 开始之后",
+  "第一章 开始之后很久",
+  "第十章",
+  "第一章",
+  "",
+  longTitle,
+  longTitle + "甲",
+  longTitle + "乙",
+  longTitle[:maxTriePrefix],
+  "cover",
+  "page01",
+  "a",
+  "ab",
+  "abc",
+  "abcd",
+  "a.b*c+d?(e)[f]",
+  ".*",
+  "(e)",
+  "missing",
+]
+
+
+@pytest.fixture
+def book(tmp_path):
+  textPath = tmp_path / "book.txt"
+  textPath.write_text("\n".join(lines) + "\n", encoding="utf-8")
+  with RawBook(str(textPath)) as book:
+    yield book
+
+
+# One pass finds the same line as one search per substring
+@pytest.mark.parametrize("prefix, suffix", [("", ""), ("[img]", "[/img]"), ("第", ""), ("", "章")])
+@pytest.mark.parametrize("startIndex", [0, 3, 6, len(lines) - 1, len(lines)])
+def testFindLinesMatchesFindLine(book, startIndex, prefix, suffix):
+  assert book.findLines(startIndex, substrings, prefix, suffix) == [book.findLine(startIndex, substring, prefix, suffix) for substring in substrings]
+
+
+def testFindLinesOfNothing(book):
+  assert book.findLines(0, []) == []
+
+
+# Random lines and substrings from a small alphabet share many prefixes and overlap often
+def testFindLinesMatchesFindLineOnRandomText(tmp_path):
+  randomGenerator = random.Random(0)
+  alphabet: str = "ab章节.*"
+  randomLines: List[str] = ["".join(randomGenerator.choices(alphabet, k=randomGenerator.randint(0, 80))) for _ in range(300)]
+  textPath = tmp_path / "book.txt"
+  textPath.write_text("\n".join(randomLines) + "\n", encoding="utf-8")
+  with RawBook(str(textPath)) as book:
+    for _ in range(20):
+      randomSubstrings: List[str] = []
+      for _ in range(50):
+        # Mostly parts of lines, found somewhere or only before startIndex
+        line: str = randomGenerator.choice(randomLines)
+        start: int = randomGenerator.randint(0, len(line))
+        randomSubstrings.append(line[start:start + randomGenerator.randint(1, maxTriePrefix + 10)] if randomGenerator.random() < 0.8 else "".join(randomGenerator.choices(alphabet, k=randomGenerator.randint(0, 8))))
+      startIndex: int = randomGenerator.randint(0, len(randomLines))
+      assert book.findLines(startIndex, randomSubstrings) == [book.findLine(startIndex, substring) for substring in randomSubstrings]
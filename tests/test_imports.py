@@ -0,0 +1,13 @@
+from benchmark import headlessModules, importBudgetMs, lazyPackages, measureImport
+
+from typing import Dict
+import pytest
+
+
+# Headless modules start fast and leave EPUB, image and UI packages unloaded
+@pytest.mark.parametrize("module", headlessModules)
+def testHeadlessImport(module: str):
+  # Fastest of a few runs, other processes slow single runs down
+  measurement: Dict = min((measureImport(module) for _ in range(3)), key=lambda measurement: measurement["time"])
+  assert measurement["lazyLoaded"] == [], "%s loads %s, only %s are imported when needed" % (module, ", ".join(measurement["lazyLoaded"]), ", ".join(sorted(lazyPackages)))
+  assert measurement["time"] * 1000 <= importBudgetMs, "importing %s takes %.1f ms, budget is %.1f ms" % (module, measurement["time"] * 1000, importBudgetMs)
@@ -0,0 +1,62 @@
+from benchmark import generateBook
+from cli import convertBook
+
+from typing import Dict, List
+import gc
+import os
+import re
+import tracemalloc
+import zipfile
+
+# Different books converted in turn until conversionCount books are converted in one process
+bookCount: int = 50
+conversionCount: int = 1000
+# Memory still allocated after all conversions may exceed memory after first pass by this much
+memorySlackBytes: int = 1 << 20
+
+
+# Content of every entry, modification time in package document changes every conversion
+def epubEntries(epubPath: str) -> Dict[str, bytes]:
+  with zipfile.ZipFile(epubPath) as epubFile:
+    entries: Dict[str, bytes] = {name: epubFile.read(name) for name in epubFile.namelist()}
+  entries["EPUB/content.opf"] = re.sub(rb'<meta property="dcterms:modified">[^<]*</meta>', b"", entries["EPUB/content.opf"])
+  return entries
+
+
+# Converting many books in one process keeps memory flat and every book only has its own data
+def testManyBooksInOneProcess(tmp_path):
+  textPaths: List[str] = [generateBook(str(tmp_path / "library" / ("%02d" % number)), 4000 + number * 200, 4 + number % 7, "tsdm" if number % 2 == 0 else "lk", seed=number) for number in range(bookCount)]
+  outputDirPath: str = str(tmp_path / "output")
+  # textPath: EPUB entries of first conversion
+  firstEntries: Dict[str, Dict[str, bytes]] = {}
+
+  tracemalloc.start()
+  try:
+    firstPassMemory: int = 0
+    for number in range(conversionCount):
+      textPath: str = textPaths[number % bookCount]
+      summary: Dict = convertBook(textPath, os.path.join(outputDirPath, os.path.basename(os.path.dirname(textPath))))
+      assert summary["error"] == ""
+      assert summary["unmatched"] == []
+
+      entries: Dict[str, bytes] = epubEntries(summary["epub"])
+      if textPath not in firstEntries:
+        # Only images next to this text are in its EPUB
+        imageNames = set(os.path.basename(name) for name in entries if name.startswith("EPUB/Images/"))
+        assert imageNames <= set(fileName for fileName in os.listdir(os.path.dirname(textPath)) if fileName.endswith(".png"))
+        with open(textPath, encoding="utf-8") as file:
+          title: str = file.readline().strip()
+        assert re.search(rb"<dc:title>(.*?)</dc:title>", entries["EPUB/content.opf"]).group(1).decode("utf-8") == title
+        firstEntries[textPath] = entries
+      else:
+        # Same book gives same EPUB whatever books were converted before it
+        assert entries == firstEntries[textPath]
+
+      if number == bookCount - 1:
+        gc.collect()
+        firstPassMemory = tracemalloc.get_traced_memory()[0]
+    gc.collect()
+    lastMemory: int = tracemalloc.get_traced_memory()[0]
+  finally:
+    tracemalloc.stop()
+  assert lastMemory - firstPassMemory <= memorySlackBytes, "memory grew by %d bytes" % (lastMemory - firstPassMemory)
@@ -0,0 +1,133 @@
+from benchmark import generateBook
+
+from typing import Dict, List, Tuple
+import io
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import zipfile
+
+simplepubPath: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "simplepub.py")
+# Book converted for seconds, keeps the only worker busy
+slowBookSize: int = 20 << 20
+timeoutSeconds: float = 120.0
+
+
+# (status, headers, body) of request to server
+def request(url: str, method: str = "GET", body: bytes = None, contentType: str = "") -> Tuple[int, Dict[str, str], bytes]:
+  httpRequest = urllib.request.Request(url, body, {"Content-Type": contentType} if contentType != "" else {}, method=method)
+  try:
+    with urllib.request.urlopen(httpRequest, timeout=timeoutSeconds) as response:
+      return response.status, dict(response.headers), response.read()
+  except urllib.error.HTTPError as error:
+    return error.code, dict(error.headers), error.read()
+
+
+def submit(baseUrl: str, textPath: str) -> Tuple[int, Dict[str, str], Dict]:
+  with open(textPath, "rb") as file:
+    status, headers, body = request(baseUrl + "/jobs", "POST", file.read(), "text/plain; charset=utf-8")
+  return status, headers, json.loads(body)
+
+
+# Poll job until its status is one of statuses
+def waitJob(baseUrl: str, jobId: str, statuses: Tuple[str, ...]) -> Dict:
+  deadline: float = time.time() + timeoutSeconds
+  while time.time() < deadline:
+    status, _, body = request(baseUrl + "/jobs/" + jobId)
+    assert status == 200
+    job: Dict = json.loads(body)
+    if job["status"] in statuses:
+      return job
+    time.sleep(0.05)
+  raise AssertionError("job %s is still %s" % (jobId, job["status"]))
+
+
+# Worker processes of server, forked workers have same command line as server
+def workerPids(serverPid: int) -> List[int]:
+  with open("/proc/%d/cmdline" % serverPid, "rb") as file:
+    serverCommand: bytes = file.read()
+  pids: List[int] = []
+  for threadId in os.listdir("/proc/%d/task" % serverPid):
+    with open("/proc/%d/task/%s/children" % (serverPid, threadId)) as file:
+      for pid in file.read().split():
+        with open("/proc/%s/cmdline" % pid, "rb") as file:
+          if file.read() == serverCommand:
+            pids.append(int(pid))
+  return pids
+
+
+# Submit, backpressure, status, download, metrics and recovery from a killed worker on a local server
+def testServeOnLocalhost(tmp_path):
+  slowTextPath: str = generateBook(str(tmp_path / "slow"), slowBookSize, 20, illustrationCount=0)
+  textPath: str = generateBook(str(tmp_path / "book"), 20000, 5, illustrationCount=0)
+  server = subprocess.Popen([sys.executable, simplepubPath, "serve", "--port", "0", "-j", "1", "--queue-size", "1", "--work", str(tmp_path / "work"), "--cache", str(tmp_path / "cache")], stderr=subprocess.PIPE, text=True)
+  try:
+    line: str = server.stderr.readline()
+    match = re.search(r"Serving on (http://\S+)", line)
+    assert match is not None, line
+    baseUrl: str = match.group(1)
+
+    # One job running and one queued fill the service, next submission is rejected
+    status, headers, slowJob = submit(baseUrl, slowTextPath)
+    assert status == 202
+    assert headers["Location"] == "/jobs/" + slowJob["id"]
+    waitJob(baseUrl, slowJob["id"], ("running",))
+    status, _, job = submit(baseUrl, textPath)
+    assert status == 202
+    assert job["status"] == "queued"
+    status, headers, body = submit(baseUrl, textPath)
+    assert status == 503
+    assert int(headers["Retry-After"]) >= 1
+    assert body["error"] == "Queue is full"
+
+    for jobId in (slowJob["id"], job["id"]):
+      assert waitJob(baseUrl, jobId, ("done", "failed"))["status"] == "done"
+    status, headers, content = request(baseUrl + "/jobs/%s/epub" % job["id"])
+    assert status == 200
+    assert headers["Content-Type"] == "application/epub+zip"
+    with zipfile.ZipFile(io.BytesIO(content)) as epubFile:
+      assert epubFile.read("mimetype") == b"application/epub+zip"
+
+    status, _, body = request(baseUrl + "/metrics")
+    assert status == 200
+    metrics: Dict = json.loads(body)
+    assert (metrics["submitted"], metrics["rejected"], metrics["converted"], metrics["failed"]) == (2, 1, 2, 0)
+    assert (metrics["queued"], metrics["running"], metrics["workers"]) == (0, 0, 1)
+    # Chapters are cached, books written into job directories are not
+    assert sorted(os.listdir(tmp_path / "cache")) == ["chapters"]
+
+    # Every request gets a response
+    for method, path, expectedStatus in [("PUT", "/jobs/" + job["id"], 405), ("POST", "/jobs/" + job["id"], 405), ("POST", "/jobs/%s/epub" % job["id"], 405), ("DELETE", "/metrics", 405), ("GET", "/jobs/%s/text" % job["id"], 404), ("GET", "/jobs/missing", 404)]:
+      status, headers, body = request(baseUrl + path, method, b"" if method != "GET" else None)
+      assert status == expectedStatus, (method, path)
+      assert "error" in json.loads(body)
+
+    # Killed worker fails its job, later jobs are converted by a new pool
+    status, _, slowJob = submit(baseUrl, slowTextPath)
+    assert status == 202
+    waitJob(baseUrl, slowJob["id"], ("running",))
+    pids: List[int] = []
+    deadline: float = time.time() + timeoutSeconds
+    while pids == [] and time.time() < deadline:
+      pids = workerPids(server.pid)
+    for pid in pids:
+      os.kill(pid, signal.SIGKILL)
+    failedJob: Dict = waitJob(baseUrl, slowJob["id"], ("done", "failed"))
+    assert failedJob["status"] == "failed"
+    assert failedJob["summary"]["error"].startswith("BrokenProcessPool")
+    status, _, job = submit(baseUrl, textPath)
+    assert status == 202
+    assert waitJob(baseUrl, job["id"], ("done", "failed"))["status"] == "done"
+    metrics = json.loads(request(baseUrl + "/metrics")[2])
+    assert (metrics["converted"], metrics["failed"]) == (3, 1)
+  finally:
+    server.send_signal(signal.SIGTERM)
+    server.wait(timeoutSeconds)
+    server.stderr.close()
+  assert server.returncode == 0
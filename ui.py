@@ -1,17 +1,463 @@
-from book import *
-from layout import *
+from book import Chapter, ChapterStatus, RawBook, RawTextType
+from book.instrumentation import Instrumentation
+from layout import Ui_MainWindow
 
 from PySide6 import QtCore, QtGui, QtWidgets
+from typing import Callable, Dict, Generator, List, Set, Tuple
+import functools
 import os
 
 
-class UI(QMainWindow):
+# Signals of book job, QRunnable can not have signals
+class BookJobSignals(QtCore.QObject):
+  # jobId, stage name, finished stage count, stage count
+  stage = QtCore.Signal(int, str, int, int)
+  # jobId, result
+  finished = QtCore.Signal(int, object)
+  # jobId, error message
+  failed = QtCore.Signal(int, str)
+  # jobId, emitted when job stops for any reason
+  done = QtCore.Signal(int)
+
+
+# Run book stages in thread pool, stage is reported when generator yields its name
+class BookJob(QtCore.QRunnable):
+  def __init__(self, jobId: int, stages: Generator[str, None, object], stageCount: int, onFinished: Callable[[object], None]):
+    super(BookJob, self).__init__()
+    self.jobId = jobId
+    self.stages = stages
+    self.stageCount = stageCount
+    self.onFinished = onFinished
+    self.cancelled = False
+    self.signals = BookJobSignals()
+
+  def cancel(self):
+    self.cancelled = True
+
+  def run(self):
+    finishedCount: int = 0
+    try:
+      while True:
+        stage: str = next(self.stages)
+        # Stop before next stage
+        if self.cancelled:
+          self.stages.close()
+          return
+        self.signals.stage.emit(self.jobId, stage, finishedCount, self.stageCount)
+        finishedCount += 1
+    except StopIteration as stopIteration:
+      if not self.cancelled:
+        self.signals.finished.emit(self.jobId, stopIteration.value)
+    except Exception as exception:
+      if not self.cancelled:
+        self.signals.failed.emit(self.jobId, "%s: %s" % (type(exception).__name__, exception))
+    finally:
+      self.signals.done.emit(self.jobId)
+
+
+# Read text file and get contents
+def openBookStages(filePath: str) -> Generator[str, None, RawBook]:
+  yield "Reading"
+  book = RawBook(filePath, Instrumentation(filePath))
+  yield "Parsing contents"
+  book.initContents()
+  yield "Locating chapters"
+  book.initChaptersIndex()
+  return book
+
+
+# Locate illustrations, chapters are located when contents are edited
+def indexBookStages(book: RawBook) -> Generator[str, None, RawBook]:
+  yield "Locating illustrations"
+  book.findIllustrationsIndex(book.illustrationPrefix, book.illustrationSuffix)
+  return book
+
+
+# Write EPUB file, written into a partial file replacing EPUB file only when job is not cancelled
+def writeBookStages(book: RawBook, epubPath: str) -> Generator[str, None, str]:
+  yield "Writing EPUB"
+  partPath: str = epubPath + ".part"
+  try:
+    book.initEpub()
+    book.writeEpub(partPath)
+    yield "Saving"
+    os.replace(partPath, epubPath)
+  finally:
+    # Failed or cancelled
+    if os.path.exists(partPath):
+      os.remove(partPath)
+  return epubPath
+
+
+# Tree of book contents over its chapters, parent of a chapter is the nearest chapter before it with lower level
+# Rows are populated lazily, edits change chapters directly and only locate edited chapters
+class ContentsModel(QtCore.QAbstractItemModel):
+  # Rows added to a parent at once when view needs more
+  fetchSize: int = 256
+  headers: List[str] = ["Chapter", "Line"]
+  statusColors: Dict[ChapterStatus, QtGui.QColor] = {ChapterStatus.notFound: QtGui.QColor(255, 200, 200), ChapterStatus.outOfOrder: QtGui.QColor(255, 230, 170)}
+  statusNames: Dict[ChapterStatus, str] = {ChapterStatus.unknown: "Not located", ChapterStatus.found: "Found", ChapterStatus.notFound: "Not found", ChapterStatus.outOfOrder: "Out of order"}
+  # Emitted after chapter locations or status may change
+  contentsChanged = QtCore.Signal()
+
+  def __init__(self, book: RawBook, parent: QtCore.QObject = None):
+    super(ContentsModel, self).__init__(parent)
+    self.book = book
+    # Fetched row count of every parent chapter number, -1 is root
+    self.fetchedCounts: Dict[int, int] = {}
+    self.buildTree()
+
+  # Parent, row and children of every chapter number by chapter level
+  def buildTree(self):
+    self.parents: List[int] = []
+    self.rows: List[int] = []
+    self.children: Dict[int, List[int]] = {-1: []}
+    # Chapter numbers from root to previous chapter
+    ancestors: List[int] = []
+    levels: List[int] = [chapter.level for chapter in self.book.contents]
+    for number, level in enumerate(levels):
+      while ancestors != [] and levels[ancestors[-1]] >= level:
+        ancestors.pop()
+      parent: int = ancestors[-1] if ancestors != [] else -1
+      self.parents.append(parent)
+      self.rows.append(len(self.children[parent]))
+      self.children[parent].append(number)
+      self.children[number] = []
+      ancestors.append(number)
+
+  # Chapter number of index, -1 is root
+  def number(self, index: QtCore.QModelIndex) -> int:
+    return index.internalId() if index.isValid() else -1
+
+  # Index of chapter number, rows before it are fetched
+  def indexOfNumber(self, number: int, column: int = 0) -> QtCore.QModelIndex:
+    if number < 0:
+      return QtCore.QModelIndex()
+    parentIndex: QtCore.QModelIndex = self.indexOfNumber(self.parents[number])
+    while self.fetchedCounts.get(self.parents[number], 0) <= self.rows[number]:
+      self.fetchMore(parentIndex)
+    return self.createIndex(self.rows[number], column, number)
+
+  def index(self, row: int, column: int, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> QtCore.QModelIndex:
+    number: int = self.number(parent)
+    if not 0 <= row < self.fetchedCounts.get(number, 0) or not 0 <= column < len(self.headers):
+      return QtCore.QModelIndex()
+    return self.createIndex(row, column, self.children[number][row])
+
+  def parent(self, index: QtCore.QModelIndex) -> QtCore.QModelIndex:
+    if not index.isValid() or self.parents[index.internalId()] < 0:
+      return QtCore.QModelIndex()
+    parent: int = self.parents[index.internalId()]
+    return self.createIndex(self.rows[parent], 0, parent)
+
+  def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+    if parent.column() > 0:
+      return 0
+    return self.fetchedCounts.get(self.number(parent), 0)
+
+  def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+    return len(self.headers)
+
+  def hasChildren(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> bool:
+    return parent.column() <= 0 and self.children[self.number(parent)] != []
+
+  def canFetchMore(self, parent: QtCore.QModelIndex) -> bool:
+    number: int = self.number(parent)
+    return self.fetchedCounts.get(number, 0) < len(self.children[number])
+
+  def fetchMore(self, parent: QtCore.QModelIndex):
+    number: int = self.number(parent)
+    fetchedCount: int = self.fetchedCounts.get(number, 0)
+    count: int = min(self.fetchSize, len(self.children[number]) - fetchedCount)
+    if count <= 0:
+      return
+    self.beginInsertRows(parent, fetchedCount, fetchedCount + count - 1)
+    self.fetchedCounts[number] = fetchedCount + count
+    self.endInsertRows()
+
+  def headerData(self, section: int, orientation: QtCore.Qt.Orientation, role: int = QtCore.Qt.DisplayRole) -> object:
+    if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+      return self.headers[section]
+    return None
+
+  def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole) -> object:
+    if not index.isValid():
+      return None
+    chapter: Chapter = self.book.contents[index.internalId()]
+    if role == QtCore.Qt.DisplayRole or role == QtCore.Qt.EditRole:
+      if index.column() == 0:
+        return chapter.string
+      return str(chapter.index + 1) if chapter.index >= 0 else ""
+    if role == QtCore.Qt.BackgroundRole:
+      return self.statusColors.get(chapter.status)
+    if role == QtCore.Qt.ToolTipRole:
+      return self.statusNames[chapter.status]
+    return None
+
+  def flags(self, index: QtCore.QModelIndex) -> QtCore.Qt.ItemFlags:
+    if not index.isValid():
+      return QtCore.Qt.NoItemFlags
+    if index.column() == 0:
+      return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEditable
+    return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+
+  # Rename chapter and locate it again
+  def setData(self, index: QtCore.QModelIndex, value: object, role: int = QtCore.Qt.EditRole) -> bool:
+    if not index.isValid() or index.column() != 0 or role != QtCore.Qt.EditRole:
+      return False
+    chapter: Chapter = self.book.contents[index.internalId()]
+    string: str = str(value).strip()
+    if string == "" or string == chapter.string:
+      return False
+    chapter.string = string
+    # Status of other chapters may change with this location
+    oldLocations: List[Tuple[int, ChapterStatus]] = [(chapter.index, chapter.status) for chapter in self.book.contents]
+    self.book.relocateChapters([index.internalId()])
+    self.book.updateChaptersStatus()
+    for number, chapter in enumerate(self.book.contents):
+      if (chapter.index, chapter.status) != oldLocations[number] or number == index.internalId():
+        if self.fetchedCounts.get(self.parents[number], 0) > self.rows[number]:
+          self.dataChanged.emit(self.createIndex(self.rows[number], 0, number), self.createIndex(self.rows[number], len(self.headers) - 1, number))
+    self.contentsChanged.emit()
+    return True
+
+  # Set chapters, old number of every chapter is -1 for new chapter
+  # View keeps selected and expanded chapters as persistent indexes are moved with their chapters
+  def changeContents(self, contents: List[Chapter], oldNumbers: List[int]):
+    self.layoutAboutToBeChanged.emit()
+    newNumbers: Dict[int, int] = {oldNumber: number for number, oldNumber in enumerate(oldNumbers) if oldNumber >= 0}
+    oldFetchedCounts: Dict[int, int] = self.fetchedCounts
+    fullyFetched: Set[int] = set(number for number, count in oldFetchedCounts.items() if count >= len(self.children[number]))
+    persistentIndexes: List[QtCore.QModelIndex] = self.persistentIndexList()
+    self.book.contents = contents
+    self.book.updateChaptersStatus()
+    self.buildTree()
+
+    # Parents keep their fetched rows, and fully fetched parents stay fully fetched
+    self.fetchedCounts = {}
+    for oldNumber, count in oldFetchedCounts.items():
+      number: int = newNumbers.get(oldNumber, -1) if oldNumber >= 0 else -1
+      if oldNumber < 0 or number >= 0:
+        self.fetchedCounts[number] = len(self.children[number]) if oldNumber in fullyFetched else min(count, len(self.children[number]))
+    newIndexes: List[QtCore.QModelIndex] = []
+    for index in persistentIndexes:
+      number: int = newNumbers.get(index.internalId(), -1)
+      if number < 0:
+        newIndexes.append(QtCore.QModelIndex())
+        continue
+      # Chapter and its ancestors are fetched
+      ancestor: int = number
+      while ancestor >= 0:
+        self.fetchedCounts[self.parents[ancestor]] = max(self.fetchedCounts.get(self.parents[ancestor], 0), self.rows[ancestor] + 1)
+        ancestor = self.parents[ancestor]
+      newIndexes.append(self.createIndex(self.rows[number], index.column(), number))
+    self.changePersistentIndexList(persistentIndexes, newIndexes)
+    self.layoutChanged.emit()
+    self.contentsChanged.emit()
+
+  # Number after the last chapter under chapter
+  def subtreeEnd(self, number: int) -> int:
+    end: int = number + 1
+    while end < len(self.book.contents) and self.book.contents[end].level > self.book.contents[number].level:
+      end += 1
+    return end
+
+  # Make chapter and chapters under it children of previous sibling, return chapter number
+  def indentChapter(self, number: int) -> int:
+    if number < 0 or self.rows[number] == 0:
+      return number
+    for chapter in self.book.contents[number:self.subtreeEnd(number)]:
+      chapter.level += 1
+    self.changeContents(list(self.book.contents), list(range(len(self.book.contents))))
+    return number
+
+  # Move chapter and chapters under it one level up, following chapters of same level become its children
+  def outdentChapter(self, number: int) -> int:
+    if number < 0 or self.book.contents[number].level == 0:
+      return number
+    for chapter in self.book.contents[number:self.subtreeEnd(number)]:
+      chapter.level = max(0, chapter.level - 1)
+    self.changeContents(list(self.book.contents), list(range(len(self.book.contents))))
+    return number
+
+  # Swap chapter and chapters under it with previous sibling
+  def moveChapterUp(self, number: int) -> int:
+    if number < 0 or self.rows[number] == 0:
+      return number
+    previous: int = self.children[self.parents[number]][self.rows[number] - 1]
+    end: int = self.subtreeEnd(number)
+    oldNumbers: List[int] = list(range(previous)) + list(range(number, end)) + list(range(previous, number)) + list(range(end, len(self.book.contents)))
+    self.changeContents([self.book.contents[oldNumber] for oldNumber in oldNumbers], oldNumbers)
+    return previous
+
+  # Swap chapter and chapters under it with next sibling
+  def moveChapterDown(self, number: int) -> int:
+    if number < 0 or self.rows[number] + 1 >= len(self.children[self.parents[number]]):
+      return number
+    nextNumber: int = self.children[self.parents[number]][self.rows[number] + 1]
+    nextSize: int = self.subtreeEnd(nextNumber) - nextNumber
+    self.moveChapterUp(nextNumber)
+    return number + nextSize
+
+  # Add empty chapter after chapter and chapters under it, at top level end without chapter, return new chapter number
+  def insertChapter(self, number: int) -> int:
+    level: int = self.book.contents[number].level if number >= 0 else 0
+    end: int = self.subtreeEnd(number) if number >= 0 else len(self.book.contents)
+    chapter = Chapter("", level, -1)
+    oldNumbers: List[int] = list(range(end)) + [-1] + list(range(end, len(self.book.contents)))
+    self.changeContents(self.book.contents[:end] + [chapter] + self.book.contents[end:], oldNumbers)
+    return end
+
+  # Remove chapter, chapters under it move under previous chapter of lower level, return next chapter number
+  def removeChapter(self, number: int) -> int:
+    if number < 0:
+      return number
+    oldNumbers: List[int] = list(range(number)) + list(range(number + 1, len(self.book.contents)))
+    self.changeContents([self.book.contents[oldNumber] for oldNumber in oldNumbers], oldNumbers)
+    return min(number, len(self.book.contents) - 1)
+
+
+# Chapter title editor showing where the edited title would be found while typing, chapter is located when edit is committed
+class ChapterDelegate(QtWidgets.QStyledItemDelegate):
+  # Emitted with status message of edited title
+  statusPreviewed = QtCore.Signal(str)
+
+  def createEditor(self, parent: QtWidgets.QWidget, option: QtWidgets.QStyleOptionViewItem, index: QtCore.QModelIndex) -> QtWidgets.QWidget:
+    editor: QtWidgets.QWidget = super(ChapterDelegate, self).createEditor(parent, option, index)
+    if index.column() == 0 and isinstance(editor, QtWidgets.QLineEdit):
+      editor.textEdited.connect(functools.partial(self.previewChapter, editor, index.model(), index.internalId()))
+    return editor
+
+  def previewChapter(self, editor: QtWidgets.QLineEdit, model: "ContentsModel", number: int, string: str):
+    index, status = model.book.previewChapter(number, string)
+    palette: QtGui.QPalette = editor.palette()
+    palette.setColor(QtGui.QPalette.Base, model.statusColors.get(status, QtWidgets.QApplication.palette(editor).color(QtGui.QPalette.Base)))
+    editor.setPalette(palette)
+    self.statusPreviewed.emit(model.statusNames[status] + (" at line %d" % (index + 1) if index >= 0 else ""))
+
+
+class UI(QtWidgets.QMainWindow):
   book: RawBook
+  contentsModel: ContentsModel = None
+  job: BookJob = None
+  jobCount: int = 0
+  # Cancelled jobs still run until their current stage ends
+  runningJobCount: int = 0
+  # jobId: book used by running job
+  jobBooks: Dict[int, RawBook]
+  # Books replaced while a running job still uses them, reset when the job ends
+  releasedBooks: List[RawBook]
 
   def __init__(self):
     super(UI, self).__init__()
     self.ui = Ui_MainWindow()
     self.ui.setupUi(self)
+    self.jobBooks = {}
+    self.releasedBooks = []
+
+    # Job progress in status bar
+    self.progressBar = QtWidgets.QProgressBar(self)
+    self.progressBar.setMaximumWidth(200)
+    self.cancelButton = QtWidgets.QPushButton("Cancel", self)
+    self.cancelButton.clicked.connect(self.cancelJob)
+    self.statusBar().addPermanentWidget(self.progressBar)
+    self.statusBar().addPermanentWidget(self.cancelButton)
+    self.progressBar.hide()
+    self.cancelButton.hide()
+
+    # Status of edited chapter title is shown while typing
+    self.chapterDelegate = ChapterDelegate(self)
+    self.chapterDelegate.statusPreviewed.connect(self.statusBar().showMessage)
+    self.ui.contentsTreeView.setItemDelegateForColumn(0, self.chapterDelegate)
+
+    # Contents are edited in place, no job may use the book meanwhile
+    self.contentsWidgets: List[QtWidgets.QWidget] = [self.ui.contentsTreeView, self.ui.addChapterButton, self.ui.removeChapterButton, self.ui.indentChapterButton, self.ui.outdentChapterButton, self.ui.moveChapterUpButton, self.ui.moveChapterDownButton]
+
+  # Start job in thread pool, previous job is discarded
+  def startJob(self, stages: Generator[str, None, object], stageCount: int, onFinished: Callable[[object], None], book: RawBook = None):
+    self.cancelJob()
+    self.jobCount += 1
+    self.runningJobCount += 1
+    if book is not None:
+      self.jobBooks[self.jobCount] = book
+    self.job = BookJob(self.jobCount, stages, stageCount, onFinished)
+    self.job.signals.stage.connect(self.showJobStage)
+    self.job.signals.finished.connect(self.finishJob)
+    self.job.signals.failed.connect(self.failJob)
+    self.job.signals.done.connect(self.endJob)
+
+    self.progressBar.setRange(0, stageCount)
+    self.progressBar.setValue(0)
+    self.progressBar.show()
+    self.cancelButton.show()
+    self.setEditingEnabled(False)
+    QtCore.QThreadPool.globalInstance().start(self.job)
+
+  @QtCore.Slot()
+  def cancelJob(self):
+    if self.job is not None:
+      self.job.cancel()
+      self.job = None
+      self.statusBar().showMessage("Cancelled")
+    self.progressBar.hide()
+    self.cancelButton.hide()
+
+  @QtCore.Slot(int)
+  def endJob(self, jobId: int):
+    self.runningJobCount -= 1
+    self.jobBooks.pop(jobId, None)
+    for book in [book for book in self.releasedBooks if not self.isBookUsed(book)]:
+      self.releasedBooks.remove(book)
+      book.reset()
+    # Book is free when no job is running
+    self.setEditingEnabled(self.runningJobCount == 0)
+
+  def setEditingEnabled(self, enabled: bool):
+    self.ui.okButton.setEnabled(enabled)
+    for widget in self.contentsWidgets:
+      widget.setEnabled(enabled)
+
+  def isCurrentJob(self, jobId: int) -> bool:
+    return self.job is not None and self.job.jobId == jobId
+
+  # Book is used by a running job, cancelled or not
+  def isBookUsed(self, book: RawBook) -> bool:
+    return any(jobBook is book for jobBook in self.jobBooks.values())
+
+  # Reset book now, or when no running job uses it
+  def releaseBook(self, book: RawBook):
+    if any(releasedBook is book for releasedBook in self.releasedBooks):
+      return
+    if self.isBookUsed(book):
+      self.releasedBooks.append(book)
+    else:
+      book.reset()
+
+  @QtCore.Slot(int, str, int, int)
+  def showJobStage(self, jobId: int, stage: str, finishedCount: int, stageCount: int):
+    if self.isCurrentJob(jobId):
+      self.progressBar.setValue(finishedCount)
+      self.statusBar().showMessage(stage + "...")
+
+  @QtCore.Slot(int, object)
+  def finishJob(self, jobId: int, result: object):
+    if not self.isCurrentJob(jobId):
+      # Release book opened by stale job
+      if isinstance(result, RawBook) and (not hasattr(self, "book") or result is not self.book):
+        self.releaseBook(result)
+      return
+    onFinished = self.job.onFinished
+    self.job = None
+    self.progressBar.hide()
+    self.cancelButton.hide()
+    self.statusBar().clearMessage()
+    onFinished(result)
+
+  @QtCore.Slot(int, str)
+  def failJob(self, jobId: int, message: str):
+    if self.isCurrentJob(jobId):
+      self.cancelJob()
+      self.statusBar().showMessage(message)
 
   @QtCore.Slot()
   def on_openFileButton_clicked(self):
@@ -20,34 +466,90 @@ class UI(QMainWindow):
 
     if filePath != "":
       self.ui.filePathLineEdit.setText(filePath)
-      self.book = RawBook(filePath)
-
-      # Display data in different raw text type
-      if self.book.rawTextType != RawTextType.default:
-        # Metadata
-        self.ui.titleLineEdit.setText(self.book.title)
-        self.ui.authorLineEdit.setText(self.book.author)
-        self.ui.illustratorLineEdit.setText(self.book.illustrator)
-        self.ui.translatorLineEdit.setText(self.book.translator)
-        self.ui.sourceLineEdit.setText(self.book.source)
-        self.ui.languageLineEdit.setText(self.book.language)
-        self.ui.subjectLineEdit.setText(self.book.subject)
-
-        # Illustration flag
-        self.ui.IllustrationPrefixLineEdit.setText(self.book.illustrationPrefix)
-        self.ui.IllustrationSuffixLineEdit.setText(self.book.illustrationSuffix)
-
-      # Display contents
-      self.book.initContents()
-      if self.book.contents != []:
-        contents: str = ""
-        for chapter in self.book.contents:
-          indent: str = "\t" * chapter.level
-          contents = contents + indent + chapter.string + "\n"
-        self.ui.contentsTextEdit.setPlainText(contents.strip())
+      self.startJob(openBookStages(filePath), 3, self.showBook)
+
+  def showBook(self, book: RawBook):
+    # Release previous book
+    if hasattr(self, "book"):
+      self.releaseBook(self.book)
+    self.book = book
+
+    # Display data in different raw text type
+    if self.book.rawTextType != RawTextType.default:
+      # Metadata
+      self.ui.titleLineEdit.setText(self.book.title)
+      self.ui.authorLineEdit.setText(self.book.author)
+      self.ui.illustratorLineEdit.setText(self.book.illustrator)
+      self.ui.translatorLineEdit.setText(self.book.translator)
+      self.ui.sourceLineEdit.setText(self.book.source)
+      self.ui.languageLineEdit.setText(self.book.language)
+      self.ui.subjectLineEdit.setText(self.book.subject)
+
+      # Illustration flag
+      self.ui.IllustrationPrefixLineEdit.setText(self.book.illustrationPrefix)
+      self.ui.IllustrationSuffixLineEdit.setText(self.book.illustrationSuffix)
+
+    # Display contents, rows are populated when shown
+    if self.contentsModel is not None:
+      self.contentsModel.deleteLater()
+    self.contentsModel = ContentsModel(self.book, self)
+    self.contentsModel.contentsChanged.connect(self.showContentsStatus)
+    self.ui.contentsTreeView.setModel(self.contentsModel)
+    self.ui.contentsTreeView.header().setStretchLastSection(False)
+    self.ui.contentsTreeView.header().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+    # Sizing line column to contents measures every row
+    self.ui.contentsTreeView.header().resizeSection(1, self.ui.contentsTreeView.fontMetrics().horizontalAdvance("00000000"))
+    self.showContentsStatus()
+
+  # Count chapters not found or out of order
+  @QtCore.Slot()
+  def showContentsStatus(self):
+    counts: Dict[ChapterStatus, int] = {status: 0 for status in ChapterStatus}
+    for chapter in self.book.contents:
+      counts[chapter.status] += 1
+    self.statusBar().showMessage("Chapters found: %d, not found: %d, out of order: %d" % (counts[ChapterStatus.found], counts[ChapterStatus.notFound], counts[ChapterStatus.outOfOrder]))
+
+  # Edit contents at current chapter, then select the returned chapter number
+  def editContents(self, edit: Callable[[int], int]) -> QtCore.QModelIndex:
+    if self.contentsModel is None or self.runningJobCount > 0:
+      return QtCore.QModelIndex()
+    currentIndex: QtCore.QModelIndex = self.ui.contentsTreeView.currentIndex()
+    index: QtCore.QModelIndex = self.contentsModel.indexOfNumber(edit(self.contentsModel.number(currentIndex)))
+    self.ui.contentsTreeView.setCurrentIndex(index)
+    self.ui.contentsTreeView.scrollTo(index)
+    return index
+
+  @QtCore.Slot()
+  def on_addChapterButton_clicked(self):
+    index: QtCore.QModelIndex = self.editContents(lambda number: self.contentsModel.insertChapter(number))
+    if index.isValid():
+      self.ui.contentsTreeView.edit(index)
+
+  @QtCore.Slot()
+  def on_removeChapterButton_clicked(self):
+    self.editContents(lambda number: self.contentsModel.removeChapter(number))
+
+  @QtCore.Slot()
+  def on_indentChapterButton_clicked(self):
+    self.editContents(lambda number: self.contentsModel.indentChapter(number))
+
+  @QtCore.Slot()
+  def on_outdentChapterButton_clicked(self):
+    self.editContents(lambda number: self.contentsModel.outdentChapter(number))
+
+  @QtCore.Slot()
+  def on_moveChapterUpButton_clicked(self):
+    self.editContents(lambda number: self.contentsModel.moveChapterUp(number))
+
+  @QtCore.Slot()
+  def on_moveChapterDownButton_clicked(self):
+    self.editContents(lambda number: self.contentsModel.moveChapterDown(number))
 
   @QtCore.Slot()
   def on_okButton_clicked(self):
+    if not hasattr(self, "book") or self.runningJobCount > 0:
+      return
+
     # Set metadata
     self.book.title = self.ui.titleLineEdit.text()
     self.book.author = self.ui.authorLineEdit.text()
@@ -61,6 +563,17 @@ class UI(QMainWindow):
     self.book.illustrationPrefix = self.ui.IllustrationPrefixLineEdit.text()
     self.book.illustrationSuffix = self.ui.IllustrationSuffixLineEdit.text()
 
-    # Set contents
-    self.book.setContents(self.ui.contentsTextEdit.toPlainText())
-    self.book.initChaptersIndex()
+    self.startJob(indexBookStages(self.book), 1, self.saveBook, self.book)
+
+  def saveBook(self, book: RawBook):
+    # Write EPUB
+    epubPath, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save File", os.path.splitext(self.ui.filePathLineEdit.text())[0] + ".epub", "EPUB Files(*.epub)")
+    if epubPath != "":
+      self.startJob(writeBookStages(book, epubPath), 2, self.showSaved, book)
+
+  # Show stage timings of book with saved path
+  def showSaved(self, epubPath: str):
+    message: str = "Saved " + epubPath
+    if isinstance(self.book.observer, Instrumentation):
+      message += " (%s)" % self.book.observer.summary()
+    self.statusBar().showMessage(message)
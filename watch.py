@@ -0,0 +1,199 @@
+from book.cache import ConversionCache, writeFileAtomic
+from cli import addConversionArguments, bookOutputDirPath, convertBook, expandPaths, imagesKey, printSummary, trimCaches
+from image import ImageOptions
+
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, List, Tuple
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+# Imported when watcher starts
+if TYPE_CHECKING:
+  from concurrent.futures import Future
+
+
+# Text file and images of a book, changes when any of them is written
+def bookSignature(textPath: str) -> Tuple[str, ...]:
+  status = os.stat(textPath)
+  return ("%d:%d" % (status.st_size, status.st_mtime_ns),) + tuple(imagesKey(os.path.dirname(textPath)))
+
+
+# Text found in inbox, converted after its files stop changing
+class PendingBook:
+  def __init__(self, signature: Tuple[str, ...], now: float):
+    self.signature = signature
+    # Last time signature changed
+    self.changedTime = now
+    # First change not converted yet, latency is measured from it
+    self.firstSeenTime = now
+
+
+# Watch inbox directories and convert finished books in warm worker processes
+class Watcher:
+  # Seconds files must stay unchanged before conversion
+  settleSeconds: float = 2.0
+  pollSeconds: float = 1.0
+  # Completed books kept for throughput and latency
+  historySize: int = 1000
+  # Trimmed after books are converted
+  conversionCache: ConversionCache = None
+  imageOptions: ImageOptions = None
+
+  def __init__(self, inboxPaths: List[str], outboxPath: str, jobs: int, convertArgs: Tuple = ()):
+    self.inboxPaths = inboxPaths
+    self.outboxPath = outboxPath
+    # Books in different inbox directories may have same name, their directories are kept in outbox
+    self.rootDirPath: str = os.path.commonpath(inboxPaths)
+    self.jobs = max(1, jobs)
+    # Arguments of convertBook after text path and output directory
+    self.convertArgs = convertArgs
+    # Started with the watcher, importing watch does not load process pools
+    from concurrent.futures import ProcessPoolExecutor
+    self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+    # textPath: book still changing
+    self.pending: Dict[str, PendingBook] = {}
+    # Ready books waiting for a worker, at most jobs books are running
+    self.queue: Deque[Tuple[str, Tuple[str, ...], float]] = deque()
+    # textPath: (future, signature, first seen time)
+    self.running: Dict[str, Tuple["Future", Tuple[str, ...], float]] = {}
+    # textPath: signature of last conversion
+    self.converted: Dict[str, Tuple[str, ...]] = {}
+    # (finish time, latency seconds) of completed books
+    self.history: Deque[Tuple[float, float]] = deque(maxlen=self.historySize)
+    self.counts: Dict[str, int] = {"converted": 0, "cached": 0, "failed": 0}
+    self.startTime: float = time.time()
+    self.stopped: bool = False
+
+  # Find new and changed books, queue books whose files stopped changing
+  def poll(self, now: float):
+    for textPath in expandPaths(self.inboxPaths):
+      try:
+        signature = bookSignature(textPath)
+      except OSError:
+        # Removed while scanning
+        continue
+      if self.converted.get(textPath) == signature or textPath in self.running or any(queued[0] == textPath for queued in self.queue):
+        continue
+      pendingBook = self.pending.get(textPath)
+      if pendingBook is None:
+        self.pending[textPath] = PendingBook(signature, now)
+      elif pendingBook.signature != signature:
+        pendingBook.signature = signature
+        pendingBook.changedTime = now
+      elif now - pendingBook.changedTime >= self.settleSeconds:
+        del self.pending[textPath]
+        self.queue.append((textPath, signature, pendingBook.firstSeenTime))
+
+  # Start queued books while workers are free
+  def submit(self):
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+    while self.queue and len(self.running) < self.jobs:
+      textPath, signature, firstSeenTime = self.queue.popleft()
+      try:
+        future = self.executor.submit(convertBook, textPath, bookOutputDirPath(textPath, self.rootDirPath, self.outboxPath), *self.convertArgs)
+      except BrokenProcessPool:
+        # A worker died, such as killed for memory on a huge book, its books failed in collect
+        self.executor.shutdown(wait=False)
+        self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+        self.queue.appendleft((textPath, signature, firstSeenTime))
+        continue
+      self.running[textPath] = (future, signature, firstSeenTime)
+
+  # Record finished books, return number of finished books
+  def collect(self, now: float) -> int:
+    finishedCount: int = 0
+    for textPath, (future, signature, firstSeenTime) in list(self.running.items()):
+      if not future.done():
+        continue
+      del self.running[textPath]
+      try:
+        summary: Dict = future.result()
+      except Exception as exception:
+        summary = {"text": textPath, "time": 0.0, "error": "%s: %s" % (type(exception).__name__, exception)}
+      printSummary(summary)
+      # Failed book is converted again only after it changes
+      self.converted[textPath] = signature
+      self.counts["failed" if summary["error"] != "" else "cached" if summary.get("cached") else "converted"] += 1
+      self.history.append((now, now - firstSeenTime))
+      finishedCount += 1
+    return finishedCount
+
+  # Queue depth, throughput and latency
+  def stats(self) -> Dict:
+    now: float = time.time()
+    latencies: List[float] = sorted(latency for _, latency in self.history)
+    lastMinute: int = len([finishTime for finishTime, _ in self.history if now - finishTime <= 60])
+    return {
+      "uptime": now - self.startTime,
+      "pending": len(self.pending),
+      "queued": len(self.queue),
+      "running": len(self.running),
+      "converted": self.counts["converted"],
+      "cached": self.counts["cached"],
+      "failed": self.counts["failed"],
+      "booksPerMinute": lastMinute,
+      "latencyAverage": sum(latencies) / len(latencies) if latencies else 0.0,
+      "latencyP95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+    }
+
+  def stop(self, *args):
+    self.stopped = True
+
+  # Poll until stopped, stats are printed and written every statsSeconds
+  def run(self, statsSeconds: float = 60.0, statsPath: str = ""):
+    lastStatsTime: float = time.time()
+    try:
+      while not self.stopped:
+        now: float = time.time()
+        if self.collect(now) > 0:
+          trimCaches(self.conversionCache, self.imageOptions)
+        self.poll(now)
+        self.submit()
+        if now - lastStatsTime >= statsSeconds:
+          lastStatsTime = now
+          self.showStats(statsPath)
+        time.sleep(self.pollSeconds)
+    finally:
+      # Running books are finished, queued books are converted on next start
+      self.executor.shutdown(wait=True)
+      self.collect(time.time())
+      self.showStats(statsPath)
+
+  def showStats(self, statsPath: str = ""):
+    stats: Dict = self.stats()
+    print("pending: %d, queued: %d, running: %d, converted: %d, cached: %d, failed: %d, %d books/min, latency avg: %.2fs, p95: %.2fs" % (stats["pending"], stats["queued"], stats["running"], stats["converted"], stats["cached"], stats["failed"], stats["booksPerMinute"], stats["latencyAverage"], stats["latencyP95"]), file=sys.stderr, flush=True)
+    if statsPath != "":
+      writeFileAtomic(os.path.abspath(statsPath), json.dumps(stats).encode("utf-8"))
+
+
+def main(argv: List[str] = None) -> int:
+  parser = argparse.ArgumentParser(prog="simplepub watch", description="Convert text files dropped into inbox directories until stopped")
+  parser.add_argument("inboxes", nargs="+", help="directories to watch")
+  parser.add_argument("-o", "--output", required=True, help="outbox directory of EPUB files")
+  parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+  parser.add_argument("--settle", type=float, default=Watcher.settleSeconds, help="seconds text and images must stay unchanged before conversion")
+  parser.add_argument("--poll", type=float, default=Watcher.pollSeconds, help="seconds between inbox scans")
+  parser.add_argument("--stats-interval", type=float, default=60.0, help="seconds between stats lines")
+  parser.add_argument("--stats", default="", help="keep current stats in this JSON file")
+  addConversionArguments(parser)
+  args = parser.parse_args(argv)
+
+  os.makedirs(args.output, exist_ok=True)
+  imageOptions = ImageOptions(args.image_max_width, args.image_max_height, args.image_format, args.image_quality, args.image_cache, args.image_cache_size << 20)
+  # Unchanged books are skipped after restart by the conversion cache
+  conversionCache = ConversionCache(args.cache, args.cache_size << 20) if not args.no_cache else None
+  watcher = Watcher([os.path.abspath(inbox) for inbox in args.inboxes], args.output, args.jobs, (imageOptions, 1, conversionCache, "", args.encoding, args.split_size * 1024, args.split_lines, 1, args.normalize, args.compress_level, not args.compress_images))
+  watcher.conversionCache = conversionCache
+  watcher.imageOptions = imageOptions
+  watcher.settleSeconds = args.settle
+  watcher.pollSeconds = args.poll
+  signal.signal(signal.SIGINT, watcher.stop)
+  signal.signal(signal.SIGTERM, watcher.stop)
+  print("Watching %s" % ", ".join(watcher.inboxPaths), file=sys.stderr, flush=True)
+  watcher.run(args.stats_interval, args.stats)
+  return 0